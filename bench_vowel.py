@@ -0,0 +1,234 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+
+from vowel_compile import compile_index, open_index
+from vowel_engine import IncrementalMatcher, RankedCandidates, VowelIndex, extract_vowels, fuzzy_budget, load_dict
+
+# =============================== 母音照合ベンチマーク ===============================
+# romaji_words.txt の音節・長音・「nn」の出方をまねた合成辞書（335語〜100万語）で、
+# 辞書読み込み・母音抽出・インデックス構築・コンパイル済み索引の mmap・1打鍵ごとの候補計算（入力長1〜8）・
+# 上位6件の並べ替え・あいまい一致（編集距離 2 まで）の検索を測る。
+#   python bench_vowel.py --out bench_results.json
+#   python bench_vowel.py --sizes 335 10000 --compare bench_results.json
+
+SYLLABLE = re.compile(r"nn|-|[^aiueo\-]*?[aiueo]|.")
+
+
+class SyllableModel:
+    # 実際の辞書から、音節の出現頻度・語の音節数・音節のあとに「nn」「-」が付く割合を数える
+    def __init__(self, words):
+        syllables = Counter()
+        lengths = Counter()
+        after = Counter()
+        for word in words:
+            n = 0
+            for s in SYLLABLE.findall(word):
+                if s in ("nn", "-"):
+                    after[s] += 1
+                else:
+                    syllables[s] += 1
+                    n += 1
+            lengths[max(n, 1)] += 1
+        total = sum(syllables.values())
+        self.syllables, self.syllable_weights = zip(*syllables.items())
+        self.lengths, self.length_weights = zip(*lengths.items())
+        self.p_nn = after["nn"] / total
+        # 「nn」が付かなかった音節のうち長音が付く割合
+        self.p_chouon = after["-"] / max(total - after["nn"], 1)
+
+    def word(self, rnd):
+        parts = []
+        for s in rnd.choices(self.syllables, self.syllable_weights, k=rnd.choices(self.lengths, self.length_weights)[0]):
+            parts.append(s)
+            if rnd.random() < self.p_nn:
+                parts.append("nn")
+            elif rnd.random() < self.p_chouon:
+                parts.append("-")
+        return "".join(parts)
+
+
+def synthetic_dict(model, size, seed, base=None):
+    rnd = random.Random(seed)
+    word_dict = dict(base or {})
+    while len(word_dict) < size:
+        r = model.word(rnd)
+        word_dict.setdefault(r, f"語{len(word_dict)}")
+    return dict(list(word_dict.items())[:size])
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {
+        "n": len(samples),
+        "p50_us": round(pick(0.50) * 1e6, 2),
+        "p99_us": round(pick(0.99) * 1e6, 2),
+        "mean_us": round(statistics.fmean(samples) * 1e6, 2),
+    }
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def peak_memory(func, *args):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def typed_inputs(index, rnd, count, max_len=8):
+    # 実在の単語の母音列を先頭から打っていく入力（長さ1〜8）
+    words = [v for _, _, v in index.entries if v]
+    return [rnd.choice(words)[:rnd.randint(1, max_len)] for _ in range(count)]
+
+
+def bench_size(model, base, size, inputs, seed):
+    rnd = random.Random(seed)
+    word_dict = synthetic_dict(model, size, seed, base)
+    result = {"words": len(word_dict)}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "words.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(f"{r},{j}\n" for r, j in word_dict.items())
+        _, result["load_dict_s"] = timed(load_dict, path)
+        _, result["load_dict_peak_bytes"] = peak_memory(load_dict, path)
+
+    _, result["extract_vowels_s"] = timed(lambda: [extract_vowels(r) for r in word_dict])
+    index, result["index_build_s"] = timed(VowelIndex, word_dict)
+    del index
+    index, result["index_peak_bytes"] = peak_memory(VowelIndex, word_dict)
+
+    patterns = typed_inputs(index, rnd, inputs)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "words.idx")
+        _, result["compile_s"] = timed(compile_index, index, path)
+        result["mapped_bytes"] = os.path.getsize(path)
+        mapped, result["mapped_open_s"] = timed(open_index, path)
+        # mmap した索引で、同じ入力を打ったときの打鍵ごとの時間と一括検索の時間
+        keystroke = {}
+        lookup = {}
+        for pattern in patterns:
+            matcher = IncrementalMatcher(mapped)
+            for ch in pattern:
+                _, t = timed(matcher.push, ch)
+                keystroke.setdefault(len(matcher.pattern), []).append(t)
+            _, t = timed(mapped.lookup_ids, pattern)
+            lookup.setdefault(len(pattern), []).append(t)
+        result["mapped_keystroke"] = {str(n): percentiles(keystroke[n]) for n in sorted(keystroke)}
+        result["mapped_lookup"] = {str(n): percentiles(lookup[n]) for n in sorted(lookup)}
+        mapped.close()
+
+    keystroke = {}
+    lookup = {}
+    ranking = {}
+    fuzzy = {}
+    for pattern in patterns:
+        # 1打鍵ずつ IncrementalMatcher に入れたときの、その打鍵の処理時間
+        matcher = IncrementalMatcher(index)
+        for ch in pattern:
+            _, t = timed(matcher.push, ch)
+            keystroke.setdefault(len(matcher.pattern), []).append(t)
+        _, t = timed(index.lookup, pattern)
+        lookup.setdefault(len(pattern), []).append(t)
+        candidates = matcher.candidates
+        _, t = timed(lambda: RankedCandidates(candidates, pattern).top(6))
+        ranking.setdefault(len(pattern), []).append(t)
+        _, t = timed(index.fuzzy_ids, pattern, fuzzy_budget(pattern, 2))
+        fuzzy.setdefault(len(pattern), []).append(t)
+
+    result["keystroke"] = {str(n): percentiles(keystroke[n]) for n in sorted(keystroke)}
+    result["lookup"] = {str(n): percentiles(lookup[n]) for n in sorted(lookup)}
+    result["top6"] = {str(n): percentiles(ranking[n]) for n in sorted(ranking)}
+    result["fuzzy"] = {str(n): percentiles(fuzzy[n]) for n in sorted(fuzzy)}
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(current, previous):
+    # 同じ辞書サイズ・同じ入力長どうしで p50 / p99 の比（今回 / 前回）を出す
+    previous = {str(r["words"]): r for r in previous["results"]}
+    for r in current["results"]:
+        old = previous.get(str(r["words"]))
+        if old is None:
+            continue
+        print(f"--- {r['words']} words (ratio = now / before)")
+        for metric in ("keystroke", "lookup", "top6", "fuzzy", "mapped_keystroke", "mapped_lookup"):
+            for n, stats in r.get(metric, {}).items():
+                before = old.get(metric, {}).get(n)
+                if before and before["p50_us"] and before["p99_us"]:
+                    print(f"{metric:16s} len={n}  p50 x{stats['p50_us'] / before['p50_us']:.2f}"
+                          f"  p99 x{stats['p99_us'] / before['p99_us']:.2f}")
+        for key in ("load_dict_s", "index_build_s", "index_peak_bytes", "mapped_open_s"):
+            if old.get(key):
+                print(f"{key:16s} x{r[key] / old[key]:.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="母音照合パイプラインのベンチマーク")
+    parser.add_argument("--dict", default="romaji_words.txt", help="合成辞書の元にする辞書")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[335, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--inputs", type=int, default=2000, help="辞書サイズごとの入力数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", help="前回の結果ファイルと比べる")
+    args = parser.parse_args(argv)
+
+    base = load_dict(args.dict)
+    model = SyllableModel(base)
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "inputs": args.inputs,
+        "seed": args.seed,
+        "results": [],
+    }
+    for size in args.sizes:
+        # 元の辞書はそのまま含め、足りない分を合成語で埋める
+        result = bench_size(model, base, size, args.inputs, args.seed)
+        report["results"].append(result)
+        worst = max(s["p99_us"] for s in result["keystroke"].values())
+        mapped_worst = max(s["p99_us"] for s in result["mapped_keystroke"].values())
+        print(f"{result['words']:>9} words  load {result['load_dict_s']:.3f}s"
+              f"  index {result['index_build_s']:.3f}s ({result['index_peak_bytes'] / 2**20:.1f} MiB)"
+              f"  mmap {result['mapped_open_s'] * 1e3:.2f}ms"
+              f"  keystroke p99 max {worst:.1f}us (mmap {mapped_worst:.1f}us)")
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"wrote {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
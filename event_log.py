@@ -0,0 +1,110 @@
+import json
+import os
+import threading
+import time
+from array import array
+
+# =============================== 打鍵ログ ===============================
+# 母音の打鍵・削除・候補の表示・ページ送り・選択を、単調増加の時計（ナノ秒）付きで1件ずつ残す。
+# 記録先はセッションごとの固定長バッファで、1件の記録は配列への代入だけ（通信もファイル書き込みもしない）。
+# 送信時（「完了！」）にセッション分をまとめて、列ごとの配列を1行にした JSON Lines へ追記する。
+#   {"submission_id": ..., "question": [...], "kind": [...], "value": [...], "t_ms": [...]}
+# t_ms は各質問の開始（start）からの経過ミリ秒。ブラウザ側キーパッドの質問は、ブラウザが記録した start が起点で、
+# t_ms はブラウザで performance.now() で測った値のまま（サーバーの時計との差は混ざらない）
+
+CAPACITY = 256  # 1セッション分。1分ほどの実験なら数十件で収まる
+KINDS = ("start", "tap", "delete", "impression", "more", "select", "not_found")
+KIND_CODES = {kind: k for k, kind in enumerate(KINDS)}
+
+
+class EventLog:
+    __slots__ = ("names", "capacity", "questions", "kinds", "values", "times", "size", "dropped", "origin", "shown")
+
+    def __init__(self, names, capacity=CAPACITY):
+        # names は質問名の並びで、記録には質問の番号（names の位置）を使う。
+        # 配列はすべて最初の start() で確保する（キーパッドまで進まないセッションには持たせない）
+        self.names = names
+        self.capacity = capacity
+        self.questions = self.kinds = b""
+        self.values = self.times = ()  # times は time.perf_counter_ns()
+        self.size = 0
+        self.dropped = 0  # いっぱいになってから捨てた件数
+        self.origin = None  # 質問ごとの start() の時刻
+        self.shown = None   # 質問ごとの、最後に記録した表示中の候補
+
+    def add(self, question, kind, value="", t_ns=None):
+        n = self.size
+        if n == len(self.kinds):
+            self.dropped += 1
+            return
+        self.times[n] = time.perf_counter_ns() if t_ns is None else t_ns
+        self.questions[n] = question
+        self.kinds[n] = KIND_CODES[kind]
+        self.values[n] = value
+        self.size = n + 1
+
+    def start(self, question, t_ns=None):
+        if not self.kinds:
+            self.questions = bytearray(self.capacity)
+            self.kinds = bytearray(self.capacity)
+            self.values = [""] * self.capacity
+            self.times = array("q", bytes(8 * self.capacity))
+            self.origin = [0] * len(self.names)
+            self.shown = [""] * len(self.names)
+        self.origin[question] = time.perf_counter_ns() if t_ns is None else t_ns
+        self.add(question, "start", t_ns=self.origin[question])
+
+    def impression(self, question, words):
+        # 表示中の候補が変わったときだけ記録する（同じ画面の描き直しは数えない）
+        value = "|".join(words)
+        if value != self.shown[question]:
+            self.shown[question] = value
+            if value:
+                self.add(question, "impression", value)
+
+    def add_client(self, question, events):
+        # ブラウザ側キーパッドが送ってきた [種類, 値, ブラウザの start からのミリ秒] の並び（先頭が start）。
+        # サーバーの時計には、最後の1件を今受け取ったものとして置く（並びと間隔はブラウザの値のまま）
+        if not events:
+            return
+        origin = time.perf_counter_ns() - int(events[-1][2] * 1e6)
+        for kind, value, t_ms in events:
+            if kind == "start":
+                self.start(question, origin + int(t_ms * 1e6))
+            elif kind in KIND_CODES:
+                self.add(question, kind, value, origin + int(t_ms * 1e6))
+
+    def columns(self):
+        n = self.size
+        return {
+            "question": [self.names[q] for q in self.questions[:n]],
+            "kind": [KINDS[k] for k in self.kinds[:n]],
+            "value": list(self.values[:n]),
+            "t_ms": [round((t - self.origin[q]) / 1e6, 3) for q, t in zip(self.questions[:n], self.times[:n])],
+            "dropped": self.dropped,
+        }
+
+# =============================== まとめて書き出す ===============================
+
+WRITE_LOCK = threading.Lock()
+
+def write_events(path, submission_id, log):
+    # 1セッション分を1行で追記する。同時に送信したセッションの行が混ざらないようロックする
+    line = json.dumps(dict(submission_id=submission_id, **log.columns()), ensure_ascii=False) + "\n"
+    with WRITE_LOCK:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+def read_events(path):
+    # 全セッションを1つの列の辞書にまとめて返す（submission_id は各行に付け直す）
+    result = {"submission_id": [], "question": [], "kind": [], "value": [], "t_ms": []}
+    if not os.path.exists(path):
+        return result
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            result["submission_id"].extend([record["submission_id"]] * len(record["kind"]))
+            for name in ("question", "kind", "value", "t_ms"):
+                result[name].extend(record[name])
+    return result
@@ -1,507 +1,475 @@
 import streamlit as st
+import hashlib
+import json
+import logging
+import os
 import random
 import time
 import streamlit.components.v1 as components
 import gspread
 from google.oauth2.service_account import Credentials
+import metrics
+from event_log import write_events
+from experiment_state import ExperimentState
+from popularity import PopularityTable
+from question_flow import ANSWER_KINDS, FLOW, QUESTION_NAMES, QUESTIONS, result_columns, sheet_row
+from sheet_writer import Outbox, SheetWriter, fake_worksheet
+from vowel_compile import OPEN_ERRORS, open_index
+from vowel_engine import IncrementalMatcher, VowelIndex, load_dict
+
+logger = logging.getLogger("experiment_app")
+
+# =============================== 計測 ===============================
+# 各区間の処理時間をプロセス内のヒストグラムに入れ、127.0.0.1:METRICS_PORT/metrics（Prometheus 形式）
+# か、METRICS_FILE に一定間隔で書き出す。1回の実行時間は rerun() かスクリプトの末尾で記録する
+run_started = time.perf_counter()
+run_phase = st.session_state.experiment.phase if "experiment" in st.session_state else "id_input"
+
+METRICS_PORT = os.environ.get("METRICS_PORT", "9464")
+METRICS_FILE = os.environ.get("METRICS_FILE")
+
+@st.cache_resource
+def start_metrics_export():
+    if METRICS_PORT:
+        try:
+            metrics.start_http_server(int(METRICS_PORT))
+        except OSError as e:
+            logger.warning("metrics endpoint not started on port %s: %s", METRICS_PORT, e)
+    if METRICS_FILE:
+        metrics.start_file_exporter(METRICS_FILE)
+    return True
+
+start_metrics_export()
+
+def rerun():
+    metrics.observe("script_run", time.perf_counter() - run_started, phase=run_phase)
+    st.rerun()
 
 @st.cache_resource
 def get_worksheet():
+    # 負荷試験などでは本物のシートの代わりにプロセス内の FakeWorksheet に書く
+    if os.environ.get("FAKE_SHEETS"):
+        return fake_worksheet()
+
     scope = [
         "https://www.googleapis.com/auth/spreadsheets",
         "https://www.googleapis.com/auth/drive"
     ]
 
-    creds = Credentials.from_service_account_info(
-        st.secrets["gcp_service_account"],
-        scopes=scope
-    )
+    with metrics.timer("sheets_auth"):
+        creds = Credentials.from_service_account_info(
+            st.secrets["gcp_service_account"],
+            scopes=scope
+        )
 
-    gc = gspread.authorize(creds)
-    sh = gc.open_by_key(SPREADSHEET_ID)
-    return sh.sheet1
+        gc = gspread.authorize(creds)
+        sh = gc.open_by_key(SPREADSHEET_ID)
+        return sh.sheet1
     
 
 # =============================== Google Sheets 接続 ===============================
 SPREADSHEET_ID = "1V8eSJwIuwHEWktTsU8VFZlSOzXuM0jUqa8jTjv1vbxQ"
 
-def append_row(data):
-    ws = get_worksheet()
-    ws.append_row(data, value_input_option="USER_ENTERED")
-
-# =============================== 母音処理関数（変更なし）===============================
-def is_chouon_word(romaji):
-    return "-" in romaji
-
-def match_pattern(word_vowels, input_pattern, romaji_word):
-    if not input_pattern:
-        return False
-    chouon = is_chouon_word(romaji_word)
-    wl, il = len(word_vowels), len(input_pattern)
-
-    if chouon:
-        if abs(wl - il) > 1:
-            return False
-        w_cut = word_vowels[:min(wl, il)]
-        i_cut = input_pattern[:min(wl, il)]
-    else:
-        if il > wl:
-            return False
-        w_cut = word_vowels[:il]
-        i_cut = input_pattern
-
-    for w, i in zip(w_cut, i_cut):
-        if i == "u":
-            if w not in ["u", "n"]:
-                return False
-        else:
-            if w != i:
-                return False
-    return True
+# 結果はまずローカルの Outbox に保存し、シートへの送信はプロセス共通の SheetWriter に任せる。
+# シートの最終列には送信IDが入り、再送しても同じ行が二重に書かれない
+OUTBOX_PATH = os.environ.get("OUTBOX_PATH", "outbox.sqlite3")
+# 打鍵ログ（event_log.py）の書き出し先。送信時にセッション分をまとめて追記する
+EVENT_LOG_PATH = os.environ.get("EVENT_LOG_PATH", "keystrokes.jsonl")
+
+@st.cache_resource
+def get_sheet_writer():
+    return SheetWriter(get_worksheet, Outbox(OUTBOX_PATH))
+
+# 選ばれた回数の表（popularity.py）。POPULARITY_REFRESH 秒ごとにバックグラウンドでシートから集計し直し、
+# 候補の同じ段階の中を回数の多い順にする。0（既定）なら使わない
+POPULARITY_REFRESH = float(os.environ.get("POPULARITY_REFRESH", "0"))
 
-def sort_key(item, input_vowels):
-    r, j, vowels = item
-    wl = len(vowels)
-    il = len(input_vowels)
-    chouon = "-" in r
-
-    if vowels == input_vowels:
-        return (0, abs(wl - il))
-    if wl == il:
-        return (1, abs(wl - il))
-    if chouon and abs(wl - il) == 1:
-        return (2, abs(wl - il))
-    return (3, abs(wl - il))
-
-def load_dict():
-    word_dict = {}
-    with open("romaji_words.txt", encoding="utf-8") as f:
-        for line in f:
-            r, j = line.strip().split(",")
-            word_dict[r] = j
-    return word_dict
-
-def extract_vowels(word):
-    vowels = "aiueo"
-    result = []
-    i = 0
-    while i < len(word):
-        if word[i] == "n":
-            count = 1
-            while i + count < len(word) and word[i + count] == "n":
-                count += 1
-            result.append("u" * (count // 2))
-            i += count
-            continue
-        if word[i] == "-":
-            result.append(result[-1] if result else "")
-            i += 1
-            continue
-        if word[i] in vowels:
-            result.append(word[i])
-        i += 1
-    return "".join(result)
-
-word_dict = load_dict()
-
-# =============================== session_state 初期化（変更なし）===============================
-if "phase" not in st.session_state:
-    st.session_state.phase = "id_input"
-
-if "experiment_id" not in st.session_state:
-    st.session_state.experiment_id = ""
-if "age_group" not in st.session_state:
-    st.session_state.age_group = ""
-if "vowel_ui_eval" not in st.session_state:
-    st.session_state.vowel_ui_eval = ""
-
-# ---------------------------
-# 味覚系 session_state 初期化
-# ---------------------------
-for key, default in {
-    "taste_list": [],
-    "taste_index": 0,
-    "taste_result": None,
-    "taste_free_text": "",
-    "taste_time_start": None,
-    "taste_time_end": None,
-    "taste_steps": 0,
-}.items():
-    if key not in st.session_state:
-        st.session_state[key] = default
-
-
-# 母音（味覚）
-for key, default in {
-    "input_vowels": "", "vowel_result": None, "vowel_free_text": "", "vowel_time_start": None,
-    "vowel_time_end": None, "vowel_steps": 0, "vowel_deletes": 0,
-}.items():
-    if key not in st.session_state:
-        st.session_state[key] = default
-
-# 体調 YES/NO
-for key, default in {
-    "body_list": [], "body_index": 0, "body_yesno_result": None,
-    "body_yesno_time_start": None, "body_yesno_time_end": None, "body_yesno_free_text": "",
-}.items():
-    if key not in st.session_state:
-        st.session_state[key] = default
-
-# 体調 母音
-for key, default in {
-    "body_input_vowels": "", "body_vowel_result": None, "body_vowel_free_text": "",
-    "body_vowel_time_start": None, "body_vowel_time_end": None,
-    "body_vowel_steps": 0, "body_vowel_deletes": 0,
-}.items():
-    if key not in st.session_state:
-        st.session_state[key] = default
-
-if "saved" not in st.session_state:
-    st.session_state.saved = False
+@st.cache_resource
+def get_popularity_table():
+    return PopularityTable(get_worksheet, result_columns(), interval=POPULARITY_REFRESH, ttl=max(POPULARITY_REFRESH * 4, 3600.0))
+
+def popularity(domain):
+    return get_popularity_table().get(domain) if POPULARITY_REFRESH > 0 else None
+
+# 最初の参加者が母音入力に来るまでに集計が済むよう、起動時から回しておく
+if POPULARITY_REFRESH > 0:
+    get_popularity_table()
+
+def append_row(data, submission_id):
+    with metrics.timer("append_row", phase=run_phase):
+        get_sheet_writer().put(submission_id, data)
+
+# =============================== 辞書読み込み ===============================
+DICT_PATH = "romaji_words.txt"
+
+# 辞書ファイルの更新を検知して作り直す。毎回の rerun では stat だけを見て、
+# 更新時刻かサイズが変わったときにハッシュを取り直し、内容が変わっていればインデックスを再構築する
+def dict_signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+@st.cache_resource(max_entries=1)
+def dict_digest(path, signature):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+@st.cache_resource(max_entries=2)
+def build_vowel_index(path, digest):
+    errors = []
+    domains = {}
+    with metrics.timer("dict_build"):
+        index = VowelIndex(load_dict(path, errors, domains), domains)
+    index.digest = digest
+    index.errors = errors
+    for lineno, line, reason in errors:
+        logger.warning("%s:%d: %s: %r", path, lineno, reason, line)
+    return index
+
+# vowel_compile.py で作った索引ファイルがあれば、テキストを解析せずに mmap して使う（同じホストのプロセスで共有される）。
+# 索引に記録された元の辞書のハッシュが今の辞書と違えば、古い索引とみなしてテキストから作る
+VOWEL_INDEX_PATH = os.environ.get("VOWEL_INDEX_PATH", "romaji_words.idx")
+
+@st.cache_resource(max_entries=2)
+def open_vowel_index(index_path, signature, path, digest):
+    try:
+        with metrics.timer("dict_open"):
+            index = open_index(index_path)
+    except OPEN_ERRORS as e:
+        # 版の違う（前の版の vowel_compile.py で作った）索引や、書きかけ・壊れたファイル
+        logger.warning("cannot use %s (%s); rebuilding from text (run vowel_compile.py)", index_path, e)
+        return None
+    if index.meta["sources"].get(os.path.basename(path)) != digest:
+        logger.warning("%s is out of date with %s; rebuilding from text (run vowel_compile.py)", index_path, path)
+        return None
+    index.digest = digest
+    index.errors = []
+    return index
+
+def get_vowel_index(path=DICT_PATH):
+    digest = dict_digest(path, dict_signature(path))
+    if os.path.exists(VOWEL_INDEX_PATH):
+        index = open_vowel_index(VOWEL_INDEX_PATH, dict_signature(VOWEL_INDEX_PATH), path, digest)
+        if index is not None:
+            return index
+    return build_vowel_index(path, digest)
+
+with metrics.timer("dict_load", phase=run_phase):
+    vowel_index = get_vowel_index()
+
+# 質問ごとに候補にする分類は question_flow.QUESTIONS の domains（romaji_words.txt の3列目）。
+# どの質問も同じ vowel_index を使い、分類はビットで絞るだけなので、質問を足しても辞書は増えない
+QUESTION_DOMAINS = {question["name"]: question["domains"] for question in QUESTIONS}
+
+def domain_mask(domain):
+    return vowel_index.domain_mask(QUESTION_DOMAINS[domain])
+
+# =============================== ブラウザ内 母音キーパッド ===============================
+# "client" では入力・削除・候補の絞り込みと並べ替えをブラウザ内で行い、
+# 選択（または「候補になかった」）のときだけ結果と回数・時刻・打鍵ログが返ってくる。
+# "server" は従来どおり1打鍵ごとに rerun する
+KEYPAD_MODE = os.environ.get("KEYPAD_MODE", "client")
+# 打ち間違いを許す編集距離（0 で従来どおり完全一致のみ、1 か 2 で一致の後ろにあいまい一致の候補を足す）
+FUZZY_DISTANCE = int(os.environ.get("FUZZY_DISTANCE", "0"))
+
+KEYPAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vowel_keypad")
+keypad_component = components.declare_component("vowel_keypad", path=KEYPAD_DIR)
+
+# 辞書（VowelIndex.compiled_json()）と選ばれた回数の表は、キーパッドと同じディレクトリに
+# 内容のハッシュを名前にした JSON（index-<ハッシュ>.json など）として置き、ブラウザが自分で取りに行く。
+# コンポーネントの引数はハッシュ・分類のビット・設定だけなので、rerun のたびに辞書を送らない
+def static_json(prefix, data):
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    path = os.path.join(KEYPAD_DIR, f"{prefix}-{digest}.json")
+    if not os.path.exists(path):
+        # 書き終わってから置き換えるので、書きかけのファイルを配ることはない
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            # 読み取り専用の配置などで書けないときは None を返し、呼ぶ側が引数で直接渡す
+            logger.warning("cannot write %s (%s); passing the data as component args", path, e)
+            return None
+    return digest
+
+@st.cache_resource(max_entries=2)
+def keypad_index_file(digest):
+    return static_json("index", vowel_index.compiled_json())
+
+@st.cache_resource(max_entries=2)
+def keypad_index_data(digest):
+    # static_json が書けなかったときに引数で渡す辞書（MappedIndex は呼ぶたびに JSON を読み直すので覚えておく）
+    return vowel_index.compiled()
+
+@st.cache_resource(max_entries=16)
+def popularity_file(domain, version):
+    data = json.dumps(get_popularity_table().get(domain), ensure_ascii=False, separators=(",", ":"))
+    # 集計し直すたびに増えるので、古い表（1日より前）は消す
+    for name in os.listdir(KEYPAD_DIR):
+        if name.startswith("popularity-"):
+            path = os.path.join(KEYPAD_DIR, name)
+            try:
+                if time.time() - os.path.getmtime(path) > 86400:
+                    os.remove(path)
+            except OSError:
+                pass  # 他のプロセスが先に消した・消せない配置
+    return static_json("popularity", data.encode("utf-8"))
+
+def vowel_keypad(key, domain, empty_message=None):
+    counts = popularity(domain)
+    # ファイルに書けていればハッシュ（文字列）、書けなかったときは中身そのものを渡す
+    index = keypad_index_file(vowel_index.digest) or keypad_index_data(vowel_index.digest)
+    if counts:
+        counts = popularity_file(domain, get_popularity_table().version) or counts
+    return keypad_component(index=index, popularity=counts or None,
+                            mask=domain_mask(domain), empty_message=empty_message, max_distance=FUZZY_DISTANCE,
+                            key=key, default=None)
+
+# =============================== session_state 初期化 ===============================
+# 1セッション分の状態は ExperimentState 1つにまとめ、最初の実行でだけ作る
+if "experiment" not in st.session_state:
+    st.session_state.experiment = ExperimentState(ANSWER_KINDS, QUESTION_NAMES)
+state = st.session_state.experiment
+
+def reset_session():
+    # 次の参加者へ。状態は reset() で戻し、キーパッドなど key 付きウィジェットの値は消す
+    state.reset()
+    for key in list(st.session_state.keys()):
+        if key != "experiment":
+            del st.session_state[key]
+
+def go(phase):
+    state.phase = phase
+    rerun()
+
+def show(elements):
+    # question_flow の (st の関数名, 文字列) の並びを描く
+    for kind, text in elements:
+        getattr(st, kind)(text)
+
+# =============================== フェーズごとの画面 ===============================
+# 質問と手順は question_flow.py の QUESTIONS に書き、ここには手順の種類ごとの画面だけを置く。
+# 各関数は現在のフェーズ（question_flow.Phase）を受け取り、質問名・文言・次のフェーズはそこから取る
 
 # =============================== 1. ID入力 ===============================
-if st.session_state.phase == "id_input":
+def id_input(phase):
     st.title("１分で終わる入力実験です")
-    st.header("これから2つの質問に答えてもらいます")
+    st.header(f"これから{len(QUESTIONS)}つの質問に答えてもらいます")
     st.header("思ったものを**「考えすぎず直感で」**選んでください")
     st.write("ニックネーム、入力時間、選択結果などは研究目的で保存されます")
-    st.session_state.experiment_id = st.text_input("ニックネーム")
-    st.session_state.age_group = st.selectbox("年齢", ["", "10代", "20代", "30代", "40代", "50代", "60代以上"])
+    state.experiment_id = st.text_input("ニックネーム")
+    state.age_group = st.selectbox("年齢", ["", "10代", "20代", "30代", "40代", "50代", "60代以上"])
 
     if st.button("スタート"):
-        if st.session_state.experiment_id.strip() and st.session_state.age_group:
-            st.session_state.taste_list = random.sample(["あまい", "からい", "すっぱい", "しょっぱい", "にがい"], 5)
-            st.session_state.taste_index = 0
-            st.session_state.taste_steps = 0
-            st.session_state.phase = "taste_vowel_intro"
-            st.rerun()
+        if state.experiment_id.strip() and state.age_group:
+            go(phase.done)
         else:
             st.warning("ニックネームと年齢を入力してください")
 
-# =============================== 味覚 母音入力 開始 ===============================
-elif st.session_state.phase == "taste_vowel_intro":
-    st.header("第1問:今、どんな味のものが食べたい？")
-    st.header("**母音だけ**で答えてください。")
-    st.write("画面左の「あいうえお」を押して入力します")
-    st.markdown("例:あまい→ああい　/ しょっぱい→おあい / あまずっぱい→ああうあい / こってり→おえい")
-    st.write("※「ん」=「う」/「じゃ」= 「あ」として入力してください")
+# =============================== 母音入力 開始 ===============================
+def vowel_intro(phase):
+    name = phase.question["name"]
+    show(phase.step["intro"])
 
     if st.button("母音入力を始める"):
-        st.session_state.input_vowels = ""
-        st.session_state.vowel_steps = 0
-        st.session_state.vowel_deletes = 0
-        st.session_state.vowel_time_start = time.time()
-        st.session_state.phase = "vowel_input"
-        st.rerun()
-
-# =============================== 味覚 母音入力 本体（スマホでも横並び！）===============================
-elif st.session_state.phase == "vowel_input":
-    st.write("どんな味が食べたい？")
-    st.caption("※「ん」=「う」 / 「じゃ」=「あ」")
-
-    # ① 母音ボタン
-    for v, label in zip(["a", "i", "u", "e", "o"], ["あ", "い", "う", "え", "お"]):
-        if st.button(label, use_container_width=True):
-            st.session_state.input_vowels += v
-            st.session_state.vowel_steps += 1
-            st.rerun()
-
-    # ② 削除
-    if st.button("⌫削除", use_container_width=True):
-        if st.session_state.input_vowels:
-            st.session_state.input_vowels = st.session_state.input_vowels[:-1]
-            st.session_state.vowel_deletes += 1
-        st.rerun()
-
-    st.markdown("---")
-
-    # ③ 入力確認表示
-    st.subheader(f"入力：{st.session_state.input_vowels}")
-
-    # ④ 候補群
-    if st.session_state.input_vowels:
-        candidates = []
-        for r, j in word_dict.items():
-            v = extract_vowels(r)
-            if match_pattern(v, st.session_state.input_vowels, r):
-                candidates.append((r, j, v))
-
-        candidates.sort(key=lambda x: sort_key(x, st.session_state.input_vowels))
-
-        for idx, (r, j, v) in enumerate(candidates[:6]):
-            if st.button(j, key=f"taste_cand_{idx}_{r}", use_container_width=True):
-                st.session_state.vowel_result = j
-                st.session_state.vowel_time_end = time.time()
-                st.session_state.phase = "save_vowel"
-                st.rerun()
-
-    # ⑤ 候補になかった
-    if st.button("候補になかった", use_container_width=True):
-        st.session_state.vowel_time_end = time.time()
-        st.session_state.phase = "vowel_free_input"
-        st.rerun()
-
-# =============================== 味覚 母音 自由入力 ===============================
-elif st.session_state.phase == "vowel_free_input":
-    st.header("では、どんな味が食べたい気分でしたか？")
-    st.session_state.vowel_free_text = st.text_input("自由入力")
-    if st.button("決定"):
-        if st.session_state.vowel_free_text.strip():
-            st.session_state.phase = "save_vowel"
-            st.rerun()
+        answer = state.answers[phase.answer]
+        answer.input = ""
+        if KEYPAD_MODE != "client":  # ブラウザ側キーパッドでは照合はブラウザで行う
+            answer.matcher = IncrementalMatcher(vowel_index, FUZZY_DISTANCE, popularity(name), domain_mask(name))
+        answer.page = 0
+        answer.steps = 0
+        answer.deletes = 0
+        answer.time_start = time.time()
+        if KEYPAD_MODE != "client":  # ブラウザ側キーパッドは自分の start を打鍵ログと一緒に返す
+            state.events.start(phase.code)
+        go(phase.phases["vowel_input"])
+
+# =============================== 母音入力 本体（ブラウザ内キーパッド）===============================
+def client_vowel_input(phase):
+    name = phase.question["name"]
+    answer = state.answers[phase.answer]
+    show(phase.step["prompt"])
+
+    keypad = vowel_keypad(f"{name}_keypad", name, empty_message=phase.step["empty_message"])
+    if keypad:
+        answer.input = keypad["input"]
+        answer.steps = keypad["steps"]
+        answer.deletes = keypad["deletes"]
+        answer.time_start = keypad["started_at"]
+        answer.time_end = keypad["ended_at"]
+        state.events.add_client(phase.code, keypad.get("events", []))
+        if keypad["result"] is None:
+            go(phase.phases["vowel_free_input"])
         else:
-            st.warning("入力してください")
-
-# =============================== 味覚 保存 → 次のフェーズ ===============================
-elif st.session_state.phase == "save_vowel":
-    st.session_state.phase = "taste_yesnoima"
-    st.rerun()
+            answer.result = keypad["result"]
+            go(phase.done)
+
+# =============================== 母音入力 本体（スマホでも横並び！）===============================
+def server_vowel_input(phase):
+    name = phase.question["name"]
+    answer = state.answers[phase.answer]
+    code = phase.code
+    show(phase.step["prompt"])
+
+    # 入力・候補まわりだけを部分的に再実行し、フェーズが変わるときだけ全体を再実行する
+    @st.fragment
+    @metrics.timed("fragment_run", phase=phase.name)
+    def keypad_fragment():
+        # 打鍵は on_click で反映してから再描画するので、打鍵ごとの st.rerun() は要らない
+        def push(v):
+            with metrics.timer("candidates", phase=phase.name):
+                answer.matcher.push(v)
+            answer.input = answer.matcher.pattern
+            answer.page = 0
+            answer.steps += 1
+            state.events.add(code, "tap", v)
+
+        def delete():
+            if answer.input:
+                with metrics.timer("candidates", phase=phase.name):
+                    answer.matcher.pop()
+                answer.input = answer.matcher.pattern
+                answer.page = 0
+                answer.deletes += 1
+                state.events.add(code, "delete")
+
+        def next_page(page_count):
+            answer.page = (answer.page + 1) % page_count
+            state.events.add(code, "more")
+
+        # ① 母音ボタン
+        for v, label in zip(["a", "i", "u", "e", "o"], ["あ", "い", "う", "え", "お"]):
+            st.button(label, key=f"{name}_vowel_{v}", use_container_width=True, on_click=push, args=(v,))
+
+        # ② 削除
+        st.button("⌫削除", key=f"{name}_delete", use_container_width=True, on_click=delete)
+
+        st.markdown("---")
+
+        # ③ 入力確認表示
+        st.subheader(f"入力：{answer.input}")
+
+        # ④ 候補群
+        if answer.input:
+            with metrics.timer("ranking", phase=phase.name):
+                ranked = answer.matcher.ranked()
+            candidates = ranked.page(answer.page)
+            state.events.impression(code, [j for _, j, _ in candidates])
+
+            if ranked.total == 0 and phase.step["empty_message"]:
+                st.info(phase.step["empty_message"])
+
+            for idx, (r, j, v) in enumerate(candidates):
+                if st.button(j, key=f"{name}_cand_{idx}_{r}", use_container_width=True):
+                    answer.result = j
+                    answer.matcher = None  # 入力は終わったので、候補のスタックを手放す
+                    state.events.add(code, "select", j)
+                    answer.time_end = time.time()
+                    state.phase = phase.done
+                    st.rerun()
+
+            if ranked.page_count() > 1:
+                st.button("他の候補", key=f"{name}_more", use_container_width=True,
+                          on_click=next_page, args=(ranked.page_count(),))
+
+        # ⑤ 候補になかった
+        if st.button("候補になかった", key=f"{name}_not_found", use_container_width=True):
+            answer.time_end = time.time()
+            answer.matcher = None
+            state.events.add(code, "not_found")
+            state.phase = phase.phases["vowel_free_input"]
+            st.rerun()
 
-# =============================== 味覚 YES/NO ===============================
-elif st.session_state.phase == "taste_yesnoima":
-    idx = st.session_state.taste_index
-    tastes = st.session_state.taste_list
-    if idx >= len(tastes):
-        st.session_state.phase = "taste_free_input"
-        st.rerun()
-    current = tastes[idx]
-    st.header("また、同じ質問をします！")
-    st.write("当てはまれば YES,違えば NO を押してください")
-    st.write("さっき答えた味覚と同じのが出るまでNOを押し続けてください")
-    if st.button("スタート"):
-        st.session_state.taste_time_start = time.time()
-        st.session_state.phase = "taste_checking"
-        st.rerun()
-
-elif st.session_state.phase == "taste_checking":
-    idx = st.session_state.taste_index
-    tastes = st.session_state.taste_list
-    if idx >= len(tastes):
-        st.session_state.taste_time_end = time.time()
-        st.session_state.phase = "taste_free_input"
-        st.rerun()
-    current = tastes[idx]
-    st.subheader(f"「{current}」味を食べたいですか？")
-    c1, c2 = st.columns(2)
-    if c1.button("YES"):
-        st.session_state.taste_steps += 1
-        st.session_state.taste_result = current
-        st.session_state.taste_time_end = time.time()
-        st.session_state.phase = "save_taste"
-        st.rerun()
-    if c2.button("NO"):
-        st.session_state.taste_steps += 1
-        st.session_state.taste_index += 1
-        st.rerun()
-
-elif st.session_state.phase == "save_taste":
-    st.session_state.phase = "body_vowel_start"
-    st.rerun()
+    keypad_fragment()
 
-elif st.session_state.phase == "taste_free_input":
-    st.header("では、どんな味の気分でしたか？")
-    st.session_state.taste_free_text = st.text_input("自由に入力してください")
+# =============================== 自由入力（母音入力・YES/NO のあと）===============================
+def free_input(phase):
+    answer = state.answers[phase.answer]
+    free = phase.step["free"]
+    if free["header"]:
+        st.header(free["header"])
+    answer.free_text = st.text_input(free["label"])
     if st.button("決定"):
-        if st.session_state.taste_free_text.strip():
-            st.session_state.phase = "body_vowel_start"
-            st.rerun()
+        if answer.free_text.strip() or not free["required"]:
+            go(phase.done)
         else:
             st.warning("入力してください")
 
-# =============================== 体調 母音入力 開始 ===============================
-elif st.session_state.phase == "body_vowel_start":
-    st.header("第2問：今の体調はどうですか？")
-    st.header("さっきと同じく「母音のみ」で答えてください。")
-    st.write("例）だるい→あうい / すっきり→ういい / ねむい→えうい / パーフェクト→ああうえお")
-    st.write("※「ん」=「う」/「じゃ」= 「あ」として入力してください")
-
-    if st.button("母音入力を始める"):
-        st.session_state.body_input_vowels = ""
-        st.session_state.body_vowel_steps = 0
-        st.session_state.body_vowel_deletes = 0
-        st.session_state.body_vowel_time_start = time.time()
-        st.session_state.phase = "body_vowel_input"
-        st.rerun()
-
-# =============================== 体調 母音入力 本体（スマホでも横並び！）===============================
-elif st.session_state.phase == "body_vowel_input":
-    st.write("今の体調に一番近いものを、母音で入力してください")
-    st.caption("※「ん」=「う」 / 「だるい」→「あうい」など")
-
-    # ① 母音ボタン
-    for v, label in zip(["a", "i", "u", "e", "o"], ["あ", "い", "う", "え", "お"]):
-        if st.button(label, key=f"body_vowel_{v}", use_container_width=True):
-            st.session_state.body_input_vowels += v
-            st.session_state.body_vowel_steps += 1
-            st.rerun()
-
-    # ② 削除
-    if st.button("⌫削除", key="body_delete", use_container_width=True):
-        if st.session_state.body_input_vowels:
-            st.session_state.body_input_vowels = st.session_state.body_input_vowels[:-1]
-            st.session_state.body_vowel_deletes += 1
-        st.rerun()
-
-    st.markdown("---")
-
-    # ③ 入力確認
-    st.subheader(f"入力：{st.session_state.body_input_vowels}")
-
-    # ④ 候補表示
-    body_word_dict = word_dict
-    if st.session_state.body_input_vowels:
-        candidates = []
-        for r, j in body_word_dict.items():
-            v = extract_vowels(r)
-            if match_pattern(v, st.session_state.body_input_vowels, r):
-                candidates.append((r, j, v))
-
-        candidates.sort(
-            key=lambda x: sort_key(x, st.session_state.body_input_vowels)
-        )
-
-        if len(candidates) == 0:
-            st.info("該当する候補がありません")
-
-        for idx, (r, j, v) in enumerate(candidates[:6]):
-            if st.button(
-                j,
-                key=f"body_cand_{idx}_{r}",
-                use_container_width=True
-            ):
-                st.session_state.body_vowel_result = j
-                st.session_state.body_vowel_time_end = time.time()
-                st.session_state.phase = "save_body_vowel"
-                st.rerun()
-
-    # ⑤ 候補になかった
-    if st.button("候補になかった", key="body_not_found", use_container_width=True):
-        st.session_state.body_vowel_time_end = time.time()
-        st.session_state.phase = "body_vowel_free_input"
-        st.rerun()
-
-
-# =============================== 体調 母音 自由入力 ===============================
-elif st.session_state.phase == "body_vowel_free_input":
-    st.session_state.body_vowel_free_text = st.text_input("体調を自由入力してください")
-    if st.button("決定"):
-        st.session_state.phase = "save_body_vowel"
-        st.rerun()
-
-# =============================== 体調 YES/NO ===============================
-elif st.session_state.phase == "save_body_vowel":
-    st.session_state.body_list = random.sample(["ねむい", "つかれた","げんき","しんどい","いそがしい"], 5)
-    st.session_state.body_index = 0
-    st.session_state.body_steps = 0
-    st.session_state.phase = "body_start"
-    st.rerun()
-    
-elif st.session_state.phase == "body_start":
-    st.header("また、同じ質問をします！")
-    st.write("当てはまれば YES,違えば NO を押してください")
-    st.write("さっき答えた体調と同じのが出るまでNOを押し続けてください")
+# =============================== YES/NO ===============================
+def yesno_intro(phase):
+    answer = state.answers[phase.answer]
+    show(phase.step["intro"])
     if st.button("スタート"):
-        st.session_state.body_yesno_time_start = time.time()
-        st.session_state.phase = "body_yesno_check"
-        st.rerun()
-
-elif st.session_state.phase == "body_yesno_check":
-    idx = st.session_state.body_index
-    if idx < len(st.session_state.body_list):
-        current = st.session_state.body_list[idx]
-        st.subheader(f"「{current}」ですか？")
+        items = phase.step["items"]
+        answer.start(random.sample(items, len(items)))
+        answer.time_start = time.time()
+        go(phase.phases["yesno_check"])
+
+def yesno_check(phase):
+    answer = state.answers[phase.answer]
+    none = phase.step["none"]
+    if answer.index < len(answer.items):
+        current = answer.items[answer.index]
+        st.subheader(phase.step["question"].format(current))
         c1, c2 = st.columns(2)
         if c1.button("YES"):
-            st.session_state.body_steps += 1
-            st.session_state.body_yesno_result = current
-            st.session_state.body_yesno_time_end = time.time()
-            st.session_state.phase = "save_body"
-            st.rerun()
+            answer.steps += 1
+            answer.result = current
+            answer.time_end = time.time()
+            go(phase.done)
         if c2.button("NO"):
-            st.session_state.body_steps += 1
-            st.session_state.body_index += 1
-            st.rerun()
+            answer.steps += 1
+            answer.index += 1
+            rerun()
+    elif none is None:
+        answer.time_end = time.time()
+        go(phase.phases["free_input"])
     else:
-        st.subheader("どれでもないですか？")
-        if st.button("どれでもない"):
-            st.session_state.body_yesno_time_end = time.time()
-            st.session_state.phase = "body_free_input"
-            st.rerun()
-
-elif st.session_state.phase == "body_free_input":
-    st.header("どんな身体の状態、体調ですか？（自由入力）")
-    st.session_state.body_yesno_free_text = st.text_input("自由入力")
-    if st.button("決定"):
-        if st.session_state.body_yesno_free_text.strip():
-            st.session_state.phase = "save_body"
-            st.rerun()
-        else:
-            st.warning("入力してください")
+        st.subheader(none["prompt"])
+        if st.button(none["label"]):
+            answer.time_end = time.time()
+            go(phase.phases["free_input"])
 
 # =============================== 最終 保存 & リセット ===============================
-elif st.session_state.phase == "save_body":
+def survey(phase):
     st.success("ありがとうございます！")
     st.write("ご協力ありがとうございました。\n最後にアンケートに協力してください！")
     st.markdown("---")
     st.subheader("最後に、操作について教えてください")
-    st.session_state.vowel_ui_eval = st.radio(
+    state.vowel_ui_eval = st.radio(
         "母音入力はわかりやすかったですか？",
         ["説明を読まずとも直感的に使えた", "例を見ればすぐ理解できた", "試しながら使い方が分かった", "最後までよくわからなかった"],
         index=None
     )
 
     if st.button("完了！"):
-        if not st.session_state.vowel_ui_eval:
+        if not state.vowel_ui_eval:
             st.warning("アンケートへの回答をお願いします")
         else:
-            if not st.session_state.saved:
-                body_yesno_start = st.session_state.body_yesno_time_start or time.time()
-                body_yesno_end   = st.session_state.body_yesno_time_end or time.time()
-                body_yesno_duration = round(body_yesno_end - body_yesno_start, 2)
-
-                body_vowel_start = st.session_state.body_vowel_time_start or time.time()
-                body_vowel_end   = st.session_state.body_vowel_time_end or time.time()
-                body_vowel_duration = round(body_vowel_end - body_vowel_start, 2)
-
-                append_row([
-                    st.session_state.experiment_id,
-                    st.session_state.taste_result,
-                    st.session_state.taste_free_text,
-                    st.session_state.taste_steps,
-                    round(st.session_state.taste_time_end - st.session_state.taste_time_start, 2) if st.session_state.taste_time_start else "",
-                    st.session_state.vowel_result,
-                    st.session_state.vowel_free_text,
-                    st.session_state.vowel_steps,
-                    st.session_state.vowel_deletes,
-                    round(st.session_state.vowel_time_end - st.session_state.vowel_time_start, 2) if st.session_state.vowel_time_start else "",
-                    st.session_state.body_yesno_result,
-                    st.session_state.body_yesno_free_text,
-                    st.session_state.body_steps,
-                    body_yesno_duration,
-                    st.session_state.body_vowel_result,
-                    st.session_state.body_vowel_free_text,
-                    st.session_state.body_vowel_steps,
-                    st.session_state.body_vowel_deletes,
-                    body_vowel_duration,
-                    st.session_state.age_group,
-                    st.session_state.vowel_ui_eval,
-                ])
-                st.session_state.saved = True
-
-            for key in list(st.session_state.keys()):
-                del st.session_state[key]
-            st.rerun()
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+            if not state.saved:
+                append_row(sheet_row(state), state.submission_id)
+                with metrics.timer("event_log_write"):
+                    write_events(EVENT_LOG_PATH, state.submission_id, state.events)
+                state.saved = True
+
+            reset_session()
+            rerun()
+
+# =============================== フェーズの振り分け ===============================
+# stage -> 画面。フェーズ名からは question_flow.FLOW を1回引くだけで決まる
+SCREENS = {
+    "id_input": id_input,
+    "vowel_intro": vowel_intro,
+    "vowel_input": client_vowel_input if KEYPAD_MODE == "client" else server_vowel_input,
+    "vowel_free_input": free_input,
+    "yesno_intro": yesno_intro,
+    "yesno_check": yesno_check,
+    "free_input": free_input,
+    "survey": survey,
+}
+
+phase = FLOW[state.phase]
+SCREENS[phase.stage](phase)
+
+metrics.observe("script_run", time.perf_counter() - run_started, phase=run_phase)
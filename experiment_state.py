@@ -0,0 +1,136 @@
+import time
+import tracemalloc
+import uuid
+
+from event_log import EventLog
+
+# =============================== 1セッション分の状態 ===============================
+# 以前は session_state に30ほどのキーを個別に置き、再実行のたびに初期化ループを回していた。
+# いまは質問ごとの小さなレコード（__slots__ 付き）をまとめた ExperimentState を1つだけ置き、
+# セッションの最初に1回作る。参加者が終わったら reset() で初期状態に戻す。
+# 回答は手順の順に並べたリスト（question_flow.ANSWER_KINDS の種類で作る）で、answers[Phase.answer] で引く。
+# 並びの情報はモジュールの定数を参照するだけで、セッションごとには持たない
+
+class VowelAnswer:
+    # 母音キーパッドでの1問分（味覚・体調で共通）
+    __slots__ = ("input", "result", "free_text", "time_start", "time_end", "steps", "deletes", "matcher", "page")
+
+    def __init__(self):
+        self.input = ""          # 入力中の母音列
+        self.result = None       # 選んだ候補（表記）
+        self.free_text = ""      # 候補になかったときの自由入力
+        self.time_start = None   # time.time()
+        self.time_end = None
+        self.steps = 0           # 母音の打鍵数
+        self.deletes = 0         # 削除の回数
+        self.matcher = None      # IncrementalMatcher（サーバー側キーパッドのみ）
+        self.page = 0            # 候補の表示ページ
+
+    def duration(self):
+        # 終わりの時刻が無ければ今までの時間
+        return round((self.time_end or time.time()) - self.time_start, 2) if self.time_start else ""
+
+
+class YesNoAnswer:
+    # 候補を1つずつ YES/NO で聞く1問分（味覚・体調で共通）
+    __slots__ = ("items", "index", "result", "free_text", "time_start", "time_end", "steps")
+
+    def __init__(self):
+        self.items = ()          # 聞く順に並べた候補（start() で入れる）
+        self.index = 0           # いま聞いている候補の位置
+        self.result = None       # YES と答えた候補
+        self.free_text = ""      # どれでもなかったときの自由入力
+        self.time_start = None
+        self.time_end = None
+        self.steps = 0           # YES/NO を押した回数
+
+    def start(self, items):
+        self.items = items
+        self.index = 0
+        self.steps = 0
+
+    def duration(self):
+        # 終わりの時刻が無ければ今までの時間
+        return round((self.time_end or time.time()) - self.time_start, 2) if self.time_start else ""
+
+
+ANSWER_TYPES = {"vowel": VowelAnswer, "yesno": YesNoAnswer}
+
+
+class ExperimentState:
+    __slots__ = ("kinds", "names", "phase", "experiment_id", "age_group", "vowel_ui_eval", "saved", "submission_id",
+                 "answers", "events")
+
+    def __init__(self, kinds, names):
+        self.kinds = kinds  # 手順の種類の並び（question_flow.ANSWER_KINDS）
+        self.names = names  # 質問名の並び（question_flow.QUESTION_NAMES。打鍵ログの question）
+        self.reset()
+
+    def reset(self):
+        # 次の参加者のために最初の状態に戻す（送信IDも新しくする）
+        self.phase = "id_input"
+        self.experiment_id = ""
+        self.age_group = ""
+        self.vowel_ui_eval = ""
+        self.saved = False
+        self.submission_id = uuid.uuid4().hex
+        self.answers = [ANSWER_TYPES[kind]() for kind in self.kinds]
+        self.events = EventLog(self.names)  # 打鍵ログ（送信時にまとめて書き出す）
+
+# =============================== 大きさ・初期化コストの計測 ===============================
+# python experiment_state.py
+
+LOOSE_KEYS = {
+    "phase": "id_input", "experiment_id": "", "age_group": "", "vowel_ui_eval": "",
+    "taste_list": [], "taste_index": 0, "taste_result": None, "taste_free_text": "",
+    "taste_time_start": None, "taste_time_end": None, "taste_steps": 0,
+    "input_vowels": "", "vowel_result": None, "vowel_free_text": "", "vowel_time_start": None,
+    "vowel_time_end": None, "vowel_steps": 0, "vowel_deletes": 0, "vowel_matcher": None, "vowel_page": 0,
+    "body_list": [], "body_index": 0, "body_yesno_result": None,
+    "body_yesno_time_start": None, "body_yesno_time_end": None, "body_yesno_free_text": "",
+    "body_input_vowels": "", "body_vowel_result": None, "body_vowel_free_text": "",
+    "body_vowel_time_start": None, "body_vowel_time_end": None,
+    "body_vowel_steps": 0, "body_vowel_deletes": 0, "body_vowel_matcher": None, "body_vowel_page": 0,
+    "saved": False, "submission_id": "",
+}
+
+
+def loose_init(state):
+    # 以前の初期化（再実行のたびに全キーを確かめる）
+    for key, default in LOOSE_KEYS.items():
+        if key not in state:
+            state[key] = list(default) if isinstance(default, list) else default
+    if not state["submission_id"]:
+        state["submission_id"] = uuid.uuid4().hex
+
+
+# 以前と同じ2問（味覚・体調）の形
+TWO_QUESTIONS = ("vowel", "yesno", "vowel", "yesno"), ("taste", "body")
+
+def record_init(state):
+    if "experiment" not in state:
+        state["experiment"] = ExperimentState(*TWO_QUESTIONS)
+
+
+def measure(init, sessions=1000, reruns=100_000):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    states = [{} for _ in range(sessions)]
+    for state in states:
+        init(state)
+    size = (tracemalloc.get_traced_memory()[0] - before) / sessions
+    tracemalloc.stop()
+    state = states[0]
+    start = time.perf_counter()
+    for _ in range(reruns):
+        init(state)
+    return {"bytes_per_session": round(size), "init_per_rerun_us": round((time.perf_counter() - start) / reruns * 1e6, 3)}
+
+
+def main():
+    for name, init in (("loose_keys", loose_init), ("record", record_init)):
+        print(name, measure(init))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from question_flow import FLOW, QUESTIONS
+
+# =============================== 同時参加者の負荷試験 ===============================
+# Streamlit の AppTest で多数の参加者を id_input から survey まで並行して進め、
+# スループット・フェーズごとの応答時間・シートへの書き込み頻度を測る。
+# シートはプロセス内の FakeWorksheet（FAKE_SHEETS=1）に置き換え、キーパッドはサーバー側（KEYPAD_MODE=server）で動かす。
+#
+# AppTest は同じプロセス内で同時に実行できないため、スクリプトの実行は1本ずつ順番に行う。
+# 実際の Streamlit プロセスでも各セッションの実行は GIL で直列化されるので、
+# 「待ち時間（前の実行が終わるまで）」と「実行時間」を分けて測れば1プロセスの処理能力が見積もれる。
+#   python loadtest.py --participants 200 --concurrency 50 --out loadtest.json
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "experiment_app.py")
+VOWEL_LABELS = dict(zip("aiueo", "あいうえお"))
+UI_EVAL = ["説明を読まずとも直感的に使えた", "例を見ればすぐ理解できた", "試しながら使い方が分かった", "最後までよくわからなかった"]
+
+
+RUN_LOCK = threading.Lock()
+
+def run(at):
+    # 戻り値: (待ち時間, 実行時間)
+    start = time.perf_counter()
+    with RUN_LOCK:
+        started = time.perf_counter()
+        at.run()
+    return started - start, time.perf_counter() - started
+
+
+def click(at, label):
+    for button in at.button:
+        if button.label == label:
+            button.click()
+            return run(at)
+    raise RuntimeError(f"button {label!r} not found in phase {at.session_state['experiment'].phase!r}")
+
+
+def labels(at):
+    return [button.label for button in at.button]
+
+
+class Participant:
+    # 1人分の操作。phase ごとの操作を1つずつ行い、操作ごとの待ち時間と実行時間を記録する
+    def __init__(self, number, rnd, targets, timeout, think):
+        from streamlit.testing.v1 import AppTest
+
+        self.number = number
+        self.rnd = rnd
+        self.targets = targets
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.think = think
+        self.samples = []  # (phase, 待ち時間, 実行時間)
+        self.done = False
+
+    def timed(self, phase, func, *args):
+        # 人が次のボタンを押すまでの間を置いてから操作する
+        if self.think:
+            time.sleep(self.rnd.expovariate(1 / self.think))
+        wait, service = func(*args)
+        self.samples.append((phase, wait, service))
+
+    def run(self):
+        self.timed("load", run, self.at)
+        while not self.done:
+            if self.at.exception:
+                raise RuntimeError(self.at.exception[0].message)
+            phase = self.at.session_state["experiment"].phase
+            # 質問ごとのフェーズは question_flow の stage で振り分ける
+            getattr(self, "on_" + FLOW[phase].stage)(phase)
+
+    def on_id_input(self, phase):
+        self.at.text_input[0].input(f"load-{self.number}")
+        self.at.selectbox[0].select(self.rnd.choice(["10代", "20代", "30代", "40代"]))
+        self.timed(phase, click, self.at, "スタート")
+
+    def on_vowel_intro(self, phase):
+        self.timed(phase, click, self.at, "母音入力を始める")
+
+    def on_vowel_input(self, phase):
+        # その質問で候補になる語（分類が質問の domains に入る語）から選ぶ
+        word, vowels = self.rnd.choice(self.targets[FLOW[phase].question["name"]])
+        # 2割ほどは打ち間違えて1文字消す
+        if self.rnd.random() < 0.2:
+            self.timed(phase, click, self.at, VOWEL_LABELS[self.rnd.choice("aiueo")])
+            self.timed(phase, click, self.at, "⌫削除")
+        for v in vowels:
+            self.timed(phase, click, self.at, VOWEL_LABELS[v])
+        if word in labels(self.at):
+            self.timed(phase, click, self.at, word)
+        else:
+            self.timed(phase, click, self.at, "候補になかった")
+
+    def on_free_input(self, phase):
+        self.at.text_input[0].input("自由入力")
+        self.timed(phase, click, self.at, "決定")
+
+    on_vowel_free_input = on_free_input
+
+    def on_yesno_intro(self, phase):
+        self.timed(phase, click, self.at, "スタート")
+
+    def on_yesno_check(self, phase):
+        if "どれでもない" in labels(self.at):
+            self.timed(phase, click, self.at, "どれでもない")
+        else:
+            self.timed(phase, click, self.at, "YES" if self.rnd.random() < 0.35 else "NO")
+
+    def on_survey(self, phase):
+        self.at.radio[0].set_value(self.rnd.choice(UI_EVAL))
+        self.timed(phase, click, self.at, "完了！")
+        self.done = True
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {
+        "n": len(samples),
+        "p50_ms": round(pick(0.50) * 1000, 2),
+        "p95_ms": round(pick(0.95) * 1000, 2),
+        "p99_ms": round(pick(0.99) * 1000, 2),
+        "max_ms": round(samples[-1] * 1000, 2),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="同時参加者の負荷試験（FakeWorksheet 使用）")
+    parser.add_argument("--participants", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--think", type=float, default=0.5, help="操作の間隔の平均（秒）")
+    parser.add_argument("--sheet-latency", type=float, default=0.5, help="append_rows 1回あたりの疑似遅延（秒）")
+    parser.add_argument("--timeout", type=float, default=60.0, help="1回の再実行の上限（秒）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="結果を書き出す JSON ファイル")
+    args = parser.parse_args(argv)
+
+    tmp = tempfile.mkdtemp(prefix="loadtest-")
+    os.environ["FAKE_SHEETS"] = "1"
+    os.environ["FAKE_SHEETS_LATENCY"] = str(args.sheet_latency)
+    os.environ["KEYPAD_MODE"] = "server"
+    os.environ["OUTBOX_PATH"] = os.path.join(tmp, "outbox.sqlite3")
+    os.environ["EVENT_LOG_PATH"] = os.path.join(tmp, "keystrokes.jsonl")
+    os.chdir(os.path.dirname(APP_PATH))
+
+    from sheet_writer import Outbox, fake_worksheet
+    from vowel_engine import VowelIndex, load_dict
+
+    domains = {}
+    index = VowelIndex(load_dict("romaji_words.txt", domains=domains), domains)
+    targets = {}
+    for question in QUESTIONS:
+        mask = index.domain_mask(question["domains"])
+        targets[question["name"]] = [(j, v) for (_, j, v), m in zip(index.entries, index.masks) if v and m & mask]
+    ws = fake_worksheet()
+
+    queue = list(range(args.participants))
+    lock = threading.Lock()
+    samples = []
+    failures = []
+    finished = []
+
+    def worker(seed):
+        rnd = random.Random(seed)
+        while True:
+            with lock:
+                if not queue:
+                    return
+                number = queue.pop()
+            participant = Participant(number, rnd, targets, args.timeout, args.think)
+            try:
+                participant.run()
+                with lock:
+                    finished.append(time.perf_counter())
+            except Exception as e:
+                with lock:
+                    failures.append(f"{number}: {e}")
+            with lock:
+                samples.extend(participant.samples)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(args.seed + k,)) for k in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    # SheetWriter が Outbox を流し切るまで待つ
+    outbox = Outbox(os.environ["OUTBOX_PATH"])
+    deadline = time.monotonic() + 60
+    while outbox.pending_count() and time.monotonic() < deadline:
+        time.sleep(0.2)
+    drained = time.perf_counter() - start
+
+    phases = {}
+    for phase, wait, service in samples:
+        phases.setdefault(phase, []).append((wait, service))
+    busy = sum(service for _, _, service in samples)
+    calls = list(ws.calls)
+    write_span = max(calls[-1][0] - calls[0][0], 1.0) if calls else 1.0
+    report = {
+        "participants": args.participants,
+        "concurrency": args.concurrency,
+        "completed": len(finished),
+        "failures": failures,
+        "elapsed_s": round(elapsed, 2),
+        "participants_per_s": round(len(finished) / elapsed, 3),
+        "interactions_per_s": round(len(samples) / elapsed, 2),
+        # スクリプト実行が占めていた時間の割合。1 に近ければ1プロセスの限界
+        "script_busy_fraction": round(busy / elapsed, 3),
+        "response": summarize([w + s for _, w, s in samples]) if samples else None,
+        "phases": {
+            phase: {
+                "response": summarize([w + s for w, s in values]),
+                "service": summarize([s for _, s in values]),
+            }
+            for phase, values in sorted(phases.items())
+        },
+        "sheets": {
+            "rows": len(ws.rows),
+            "calls": len(calls),
+            "rows_per_call": round(len(ws.rows) / len(calls), 2) if calls else 0,
+            "calls_per_min": round(len(calls) / write_span * 60, 2),
+            "pending_after_drain": outbox.pending_count(),
+            "drain_s": round(drained, 2),
+        },
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# =============================== 計測（プロセス内ヒストグラム）===============================
+# 処理時間を固定バケットのヒストグラムに入れ、Prometheus のテキスト形式で出す。
+# 1回の記録は bisect とカウンタの加算だけなので、ボタン1回の処理にほとんど影響しない
+
+PREFIX = "mother_sound_"
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}  # (名前, ラベル) -> Histogram
+        self.counters = {}    # (名前, ラベル) -> 値
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(seconds)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render(self):
+        with self.lock:
+            histograms = [(k, list(h.counts), h.sum, h.count) for k, h in sorted(self.histograms.items())]
+            counters = sorted(self.counters.items())
+        lines = []
+        seen = set()
+        for (name, labels), counts, total, count in histograms:
+            metric = f"{PREFIX}{name}_seconds"
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, n in zip(BUCKETS + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{metric}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{metric}_sum{format_labels(labels)} {total}")
+            lines.append(f"{metric}_count{format_labels(labels)} {count}")
+        for (name, labels), value in counters:
+            metric = f"{PREFIX}{name}_total"
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+REGISTRY = Registry()
+observe = REGISTRY.observe
+inc = REGISTRY.inc
+timer = REGISTRY.timer
+
+
+def timed(name, **labels):
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# =============================== 出力 ===============================
+# ローカルの HTTP（/metrics）か、一定間隔で書き換えるファイル（古いものは .1, .2 ... に回す）
+
+def start_http_server(port, host="127.0.0.1", registry=REGISTRY):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def start_file_exporter(path, interval=60.0, keep=5, registry=REGISTRY):
+    def rotate():
+        for n in range(keep - 1, 0, -1):
+            src = path if n == 1 else f"{path}.{n - 1}"
+            if os.path.exists(src):
+                os.replace(src, f"{path}.{n}")
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                rotate()
+                tmp = f"{path}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(f"# {time.strftime('%Y-%m-%dT%H:%M:%S%z')}\n")
+                    f.write(registry.render())
+                os.replace(tmp, path)
+            except OSError as e:
+                logger.warning("failed to write metrics to %s: %s", path, e)
+
+    thread = threading.Thread(target=run, name="metrics-file", daemon=True)
+    thread.start()
+    return thread
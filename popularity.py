@@ -0,0 +1,61 @@
+import logging
+import threading
+import time
+from collections import Counter
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# =============================== 選ばれた回数の表 ===============================
+# これまでに母音入力で選ばれた候補を質問ごとに数えた表。
+# 集計はバックグラウンドのスレッドがシート全体を読み直して行い、出来上がった辞書を丸ごと差し替える。
+# 画面側は get() で今ある辞書を受け取るだけなので、シートへの通信は起きず、1語の参照は O(1)。
+# 最後の集計から ttl 秒たっても読み直せていなければ表は捨て、回数なしの並びに戻す
+
+# columns は 質問名 -> 選んだ候補のシートの列（0 始まり）。question_flow.result_columns() の値
+EMPTY = {}
+
+
+def aggregate(rows, columns):
+    counts = {domain: Counter() for domain in columns}
+    for row in rows:
+        for domain, col in columns.items():
+            if col < len(row) and row[col]:
+                counts[domain][row[col]] += 1
+    return {domain: dict(c) for domain, c in counts.items()}
+
+
+class PopularityTable:
+    def __init__(self, get_worksheet, columns, interval=300.0, ttl=3600.0):
+        self.get_worksheet = get_worksheet
+        self.columns = columns
+        self.interval = interval
+        self.ttl = ttl
+        self.tables = EMPTY
+        self.loaded_at = None  # time.monotonic()
+        self.version = 0  # 集計し直すたびに増える
+        self.thread = threading.Thread(target=self.run, name="popularity", daemon=True)
+        self.thread.start()
+
+    def get(self, domain):
+        loaded_at = self.loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.ttl:
+            return EMPTY
+        return self.tables.get(domain, EMPTY)
+
+    def refresh(self):
+        with metrics.timer("popularity_refresh"):
+            tables = aggregate(self.get_worksheet().get_all_values(), self.columns)
+        self.tables = tables
+        self.loaded_at = time.monotonic()
+        self.version += 1
+
+    def run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                metrics.inc("popularity_errors")
+                logger.warning("failed to refresh popularity table: %s", e)
+            time.sleep(self.interval)
@@ -0,0 +1,167 @@
+from vowel_engine import GENERAL
+
+# =============================== 質問の定義 ===============================
+# 質問ごとに、答えてもらう手順（steps）を上から順に書く。手順は2種類：
+#   vowel  母音キーパッドで入力 → 候補から選ぶ（なければ自由入力）
+#   yesno  items を1つずつ YES/NO で聞く（どれでもなければ自由入力）
+# 1つの質問に同じ種類の手順は1つまで。画面の文言は (st の関数名, 文字列) の並び。
+# 質問を足すときはここに1つ足すだけでよい
+# （フェーズ表・シートの列・打鍵ログ・選ばれた回数の表はここから作られる）
+
+QUESTIONS = [
+    {
+        "name": "taste",
+        "domains": ("taste", GENERAL),  # 母音入力の候補にする分類（romaji_words.txt の3列目）
+        "steps": [
+            {
+                "kind": "vowel",
+                "intro": [
+                    ("header", "第1問:今、どんな味のものが食べたい？"),
+                    ("header", "**母音だけ**で答えてください。"),
+                    ("write", "画面左の「あいうえお」を押して入力します"),
+                    ("markdown", "例:あまい→ああい　/ しょっぱい→おあい / あまずっぱい→ああうあい / こってり→おえい"),
+                    ("write", "※「ん」=「う」/「じゃ」= 「あ」として入力してください"),
+                ],
+                "prompt": [("write", "どんな味が食べたい？"), ("caption", "※「ん」=「う」 / 「じゃ」=「あ」")],
+                "empty_message": None,
+                "free": {"header": "では、どんな味が食べたい気分でしたか？", "label": "自由入力", "required": True},
+            },
+            {
+                "kind": "yesno",
+                "items": ["あまい", "からい", "すっぱい", "しょっぱい", "にがい"],
+                "intro": [
+                    ("header", "また、同じ質問をします！"),
+                    ("write", "当てはまれば YES,違えば NO を押してください"),
+                    ("write", "さっき答えた味覚と同じのが出るまでNOを押し続けてください"),
+                ],
+                "question": "「{}」味を食べたいですか？",
+                "none": None,  # すべて NO なら、そのまま自由入力へ
+                "free": {"header": "では、どんな味の気分でしたか？", "label": "自由に入力してください", "required": True},
+            },
+        ],
+    },
+    {
+        "name": "body",
+        "domains": ("body", GENERAL),
+        "steps": [
+            {
+                "kind": "vowel",
+                "intro": [
+                    ("header", "第2問：今の体調はどうですか？"),
+                    ("header", "さっきと同じく「母音のみ」で答えてください。"),
+                    ("write", "例）だるい→あうい / すっきり→ういい / ねむい→えうい / パーフェクト→ああうえお"),
+                    ("write", "※「ん」=「う」/「じゃ」= 「あ」として入力してください"),
+                ],
+                "prompt": [
+                    ("write", "今の体調に一番近いものを、母音で入力してください"),
+                    ("caption", "※「ん」=「う」 / 「だるい」→「あうい」など"),
+                ],
+                "empty_message": "該当する候補がありません",
+                "free": {"header": None, "label": "体調を自由入力してください", "required": False},
+            },
+            {
+                "kind": "yesno",
+                "items": ["ねむい", "つかれた", "げんき", "しんどい", "いそがしい"],
+                "intro": [
+                    ("header", "また、同じ質問をします！"),
+                    ("write", "当てはまれば YES,違えば NO を押してください"),
+                    ("write", "さっき答えた体調と同じのが出るまでNOを押し続けてください"),
+                ],
+                "question": "「{}」ですか？",
+                "none": {"prompt": "どれでもないですか？", "label": "どれでもない"},
+                "free": {"header": "どんな身体の状態、体調ですか？（自由入力）", "label": "自由入力", "required": True},
+            },
+        ],
+    },
+]
+
+# =============================== フェーズ表 ===============================
+# 手順ごとのフェーズ（stage）は決まっていて、フェーズ名は「質問名_stage」。
+# compile_flow() は フェーズ名 -> Phase の辞書を1回だけ作り、画面側は state.phase で1回引くだけで
+# 描く処理（stage）・質問・手順・次のフェーズが分かる（質問が増えても if/elif を辿らない）
+
+FIRST_PHASE = "id_input"
+LAST_PHASE = "survey"
+STAGES = {
+    "vowel": ("vowel_intro", "vowel_input", "vowel_free_input"),
+    "yesno": ("yesno_intro", "yesno_check", "free_input"),
+}
+
+
+class Phase:
+    __slots__ = ("name", "stage", "question", "code", "step", "answer", "phases", "done")
+
+    def __init__(self, name, stage, question=None, code=None, step=None, answer=None):
+        self.name = name
+        self.stage = stage        # 描く処理の名前
+        self.question = question  # QUESTIONS の要素（id_input / survey は None）
+        self.code = code          # 質問の番号（打鍵ログの question）
+        self.step = step          # steps の要素
+        self.answer = answer      # 手順の番号（ExperimentState.answers の位置）
+        self.phases = {}          # 同じ手順の stage -> フェーズ名
+        self.done = None          # この手順が終わったら進むフェーズ
+
+
+def compile_flow(questions):
+    flow = {FIRST_PHASE: Phase(FIRST_PHASE, FIRST_PHASE), LAST_PHASE: Phase(LAST_PHASE, LAST_PHASE)}
+    starts = []  # 各手順の最初のフェーズ
+    steps = []
+    for code, question in enumerate(questions):
+        for step in question["steps"]:
+            phases = {stage: f"{question['name']}_{stage}" for stage in STAGES[step["kind"]]}
+            for stage, name in phases.items():
+                flow[name] = Phase(name, stage, question, code, step, len(steps))
+                flow[name].phases = phases
+            starts.append(phases[STAGES[step["kind"]][0]])
+            steps.append(phases)
+    # 手順を順につないで1本の流れにする
+    flow[FIRST_PHASE].done = starts[0] if starts else LAST_PHASE
+    for phases, done in zip(steps, starts[1:] + [LAST_PHASE]):
+        for name in phases.values():
+            flow[name].done = done
+    return flow
+
+
+FLOW = compile_flow(QUESTIONS)
+QUESTION_NAMES = tuple(question["name"] for question in QUESTIONS)
+# ExperimentState.answers の並び（手順の順。Phase.answer はこの位置）：(質問名, 手順の種類)
+ANSWERS = tuple((question["name"], step["kind"]) for question in QUESTIONS for step in question["steps"])
+ANSWER_KINDS = tuple(kind for _, kind in ANSWERS)
+
+# =============================== シートの1行 ===============================
+# [ニックネーム, 質問ごとの列..., 年齢, 操作の評価] の順（末尾に SheetWriter が送信IDを付ける）。
+# 質問の中は 回答の順ではなく YES/NO → 母音 の順に並べる（以前からのシートの列の並び）
+
+SHEET_ORDER = ("yesno", "vowel")
+SHEET_COLUMNS = {
+    "yesno": ("result", "free_text", "steps", "duration"),
+    "vowel": ("result", "free_text", "steps", "deletes", "duration"),
+}
+
+
+def sheet_layout(answers=ANSWERS):
+    # [(answers の位置, 質問名, 手順の種類), ...] をシートの並びで
+    names = list(dict.fromkeys(name for name, _ in answers))
+    order = {(name, kind): k for k, (name, kind) in enumerate(answers)}
+    return [(order[name, kind], name, kind) for name in names for kind in SHEET_ORDER if (name, kind) in order]
+
+
+def sheet_row(state, answers=ANSWERS):
+    row = [state.experiment_id]
+    for position, _, kind in sheet_layout(answers):
+        answer = state.answers[position]
+        row.extend(answer.duration() if column == "duration" else getattr(answer, column)
+                   for column in SHEET_COLUMNS[kind])
+    row.extend([state.age_group, state.vowel_ui_eval])
+    return row
+
+
+def result_columns(answers=ANSWERS):
+    # 質問名 -> 母音入力で選んだ候補の列（0 始まり）。popularity.py の集計に使う
+    columns = {}
+    col = 1
+    for _, name, kind in sheet_layout(answers):
+        if kind == "vowel":
+            columns[name] = col
+        col += len(SHEET_COLUMNS[kind])
+    return columns
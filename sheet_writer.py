@@ -0,0 +1,325 @@
+import argparse
+import atexit
+import json
+import logging
+import os
+import random
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# =============================== 送信待ちの行（ローカル保存）===============================
+# 結果はまず SQLite（WAL）に書いてから返す。シートへの送信はあとから SheetWriter が行い、
+# 送信済みになるまで行は残るので、Sheets が落ちていてもプロセスが落ちても失われない。
+# 同じ Outbox を複数のプロセスが送るときは、claim() で行に自分の名前（claimed_by）を付けてから送るので、
+# 同じ行を2つのプロセスが送ることはない。claim_ttl 秒たっても送れていない行は、落ちたプロセスの分とみなして取り直す。
+# 再試行しても通らないエラーの行は failed / error を付けて送るのをやめる（failed を NULL に戻せば送り直される）
+
+class Outbox:
+    def __init__(self, path, synchronous="FULL", claim_ttl=120.0):
+        self.lock = threading.Lock()
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+        self.claim_ttl = claim_ttl
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + FULL はコミットごとに WAL への追記1回と fsync 1回で済む
+        self.conn.execute(f"PRAGMA synchronous={synchronous}")
+        # 他のプロセスが書いている間は待つ
+        self.conn.execute("PRAGMA busy_timeout=10000")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " submission_id TEXT NOT NULL UNIQUE,"
+            " row TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " sent REAL,"
+            " claimed_by TEXT,"
+            " claimed_at REAL,"
+            " failed REAL,"
+            " error TEXT)"
+        )
+        # 以前の版で作ったファイルには claimed_by 以降の列が無い
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(outbox)")}
+        for column, kind in (("claimed_by", "TEXT"), ("claimed_at", "REAL"), ("failed", "REAL"), ("error", "TEXT")):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE outbox ADD COLUMN {column} {kind}")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS outbox_pending ON outbox(id) WHERE sent IS NULL")
+
+    def add(self, submission_id, row):
+        # 同じ送信IDの二重登録は無視する（「完了！」の連打など）
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO outbox (submission_id, row, created) VALUES (?, ?, ?)",
+                (submission_id, json.dumps(row, ensure_ascii=False), time.time()),
+            )
+
+    def claim(self, limit):
+        # 誰も持っていない行（と、自分が前に取って送れなかった行・期限切れの行）を古い順に limit 行取る
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            # SELECT と UPDATE の間に他のプロセスは書けない（BEGIN IMMEDIATE で書き込みロックを取っている）。
+            # UPDATE ... RETURNING は SQLite 3.35 からなので使わない
+            try:
+                rows = self.conn.execute(
+                    "SELECT id, submission_id, row FROM outbox WHERE sent IS NULL AND failed IS NULL"
+                    " AND (claimed_by IS NULL OR claimed_by = ? OR claimed_at < ?)"
+                    " ORDER BY id LIMIT ?",
+                    (self.owner, now - self.claim_ttl, limit),
+                ).fetchall()
+                self.conn.executemany(
+                    "UPDATE outbox SET claimed_by = ?, claimed_at = ? WHERE id = ?",
+                    [(self.owner, now, row_id) for row_id, _, _ in rows],
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return [(sid, json.loads(row)) for _, sid, row in rows]
+
+    def release(self, submission_ids):
+        # 送れなかった行を手放して、他のプロセスがすぐ取れるようにする
+        self.update("claimed_by = NULL, claimed_at = NULL", (), submission_ids)
+
+    def renew(self, submission_ids):
+        # 再試行で時間がかかっている行の期限を延ばす（他のプロセスに取り直されないように）
+        self.update("claimed_at = ?", (time.time(),), submission_ids)
+
+    def pending_count(self):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE sent IS NULL AND failed IS NULL"
+            ).fetchone()[0]
+
+    def failed_count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM outbox WHERE failed IS NOT NULL").fetchone()[0]
+
+    def mark_sent(self, submission_ids):
+        self.update("sent = ?", (time.time(),), submission_ids)
+
+    def mark_failed(self, submission_ids, error):
+        self.update("failed = ?, error = ?, claimed_by = NULL, claimed_at = NULL", (time.time(), error),
+                    submission_ids)
+
+    def update(self, assignments, values, submission_ids):
+        with self.lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                f"UPDATE outbox SET {assignments} WHERE submission_id = ?",
+                [(*values, sid) for sid in submission_ids],
+            )
+            self.conn.execute("COMMIT")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+# =============================== Google Sheets 書き込みスレッド ===============================
+# Outbox にたまった全セッションの行を、一定間隔ごとに append_rows でまとめて書き込む。
+# 各行の末尾には送信IDを付け、送信できたか分からない行はシートの送信ID列と照合してから送り直す
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+def is_retryable(error):
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    # ステータスの無い例外（通信エラーなど）も再試行する
+    return status is None or status in RETRY_STATUS
+
+
+class SheetWriter:
+    def __init__(self, get_worksheet, outbox, interval=2.0, batch_size=100, max_backoff=64.0):
+        self.get_worksheet = get_worksheet
+        self.outbox = outbox
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_backoff = max_backoff
+        self.wakeup = threading.Event()
+        self.closing = threading.Event()
+        self.deadline = float("inf")
+        # 起動直後は前回のプロセスが送信済みかもしれない行が残っているので、最初にシートと照合する
+        self.verified = False
+        self.batches = 0
+        self.rows = 0
+        self.errors = 0
+        self.thread = threading.Thread(target=self.run, name="sheet-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def put(self, submission_id, row):
+        self.outbox.add(submission_id, list(row) + [submission_id])
+        self.wakeup.set()
+
+    def run(self):
+        delay = 1.0
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            # 他のセッションの行がたまるのを少し待ってからまとめて送る
+            self.closing.wait(self.interval)
+            try:
+                self.drain()
+                delay = 1.0
+            except Exception as e:
+                # Outbox（SQLite）のエラーでスレッドが止まると、以降の行がすべて送られなくなる。
+                # 記録して少し待ち、次の周期でやり直す（行は Outbox に残っている）
+                self.errors += 1
+                metrics.inc("sheets_errors", status=type(e).__name__)
+                logger.exception("sheet writer failed, retrying in %.1fs", delay)
+                if not self.closing.is_set():
+                    self.closing.wait(delay)
+                    delay = min(delay * 2, self.max_backoff)
+            if self.closing.is_set():
+                return
+
+    def drain(self):
+        while True:
+            batch = self.outbox.claim(self.batch_size)
+            if not batch or not self.send(batch):
+                return
+
+    def skip_sent(self, ws, batch):
+        with metrics.timer("sheets_col_values"):
+            existing = set(ws.col_values(len(batch[0][1])))
+        sent = [sid for sid, _ in batch if sid in existing]
+        if sent:
+            logger.info("skipping %d rows already in the sheet", len(sent))
+            self.outbox.mark_sent(sent)
+        return [(sid, row) for sid, row in batch if sid not in existing]
+
+    def send(self, batch):
+        delay = 1.0
+        while True:
+            try:
+                ws = self.get_worksheet()
+                if not self.verified:
+                    batch = self.skip_sent(ws, batch)
+                    self.verified = True
+                if batch:
+                    with metrics.timer("sheets_append_rows"):
+                        ws.append_rows([row for _, row in batch], value_input_option="USER_ENTERED")
+                    self.outbox.mark_sent([sid for sid, _ in batch])
+                    self.batches += 1
+                    self.rows += len(batch)
+                    metrics.inc("sheets_rows", len(batch))
+                return True
+            except Exception as e:
+                self.errors += 1
+                status = getattr(getattr(e, "response", None), "status_code", None)
+                metrics.inc("sheets_errors", status=status or type(e).__name__)
+                # 書き込めたかどうか分からないので、次は送る前にシートと照合する
+                self.verified = False
+                if not is_retryable(e):
+                    # 送り直しても通らないので、先頭の行で詰まらないよう送るのをやめて理由を残す
+                    logger.error("giving up on %d rows: %s", len(batch), e)
+                    self.outbox.mark_failed([sid for sid, _ in batch], f"{type(e).__name__}: {e}")
+                    metrics.inc("sheets_failed_rows", len(batch))
+                    return True
+                if time.monotonic() + delay > self.deadline:
+                    # 行は Outbox に残り、次の周期か次回起動時（か他のプロセス）に送り直される
+                    logger.error("failed to write %d rows: %s", len(batch), e)
+                    self.outbox.release([sid for sid, _ in batch])
+                    return False
+                logger.warning("sheet write failed (%s), retrying in %.1fs", e, delay)
+                time.sleep(delay + random.uniform(0, delay / 2))
+                delay = min(delay * 2, self.max_backoff)
+                self.outbox.renew([sid for sid, _ in batch])
+
+    def close(self, timeout=30.0):
+        # 終了時に残りを書き出す。間に合わなかった分は次回起動時に送られる
+        if self.closing.is_set():
+            return
+        self.deadline = time.monotonic() + timeout
+        self.closing.set()
+        self.wakeup.set()
+        self.thread.join(timeout)
+
+# =============================== ローカル検証用ワークシート ===============================
+# gspread の Worksheet の代わりに使う。append_rows / append_row / col_values / get_all_values だけを持つ
+
+class FakeWorksheet:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.rows = []
+        self.calls = []  # (時刻, 行数)
+
+    def append_rows(self, values, value_input_option=None):
+        time.sleep(self.latency)
+        with self.lock:
+            self.rows.extend(list(row) for row in values)
+            self.calls.append((time.time(), len(values)))
+
+    def append_row(self, values, value_input_option=None):
+        self.append_rows([values], value_input_option)
+
+    def col_values(self, col):
+        with self.lock:
+            return [row[col - 1] if len(row) >= col else "" for row in self.rows]
+
+    def get_all_values(self):
+        with self.lock:
+            return [list(row) for row in self.rows]
+
+
+# プロセスで1つの FakeWorksheet。アプリ（FAKE_SHEETS=1）と負荷試験が同じものを見る
+FAKE_WORKSHEET = None
+FAKE_WORKSHEET_LOCK = threading.Lock()
+
+def fake_worksheet():
+    global FAKE_WORKSHEET
+    with FAKE_WORKSHEET_LOCK:
+        if FAKE_WORKSHEET is None:
+            FAKE_WORKSHEET = FakeWorksheet(float(os.environ.get("FAKE_SHEETS_LATENCY", "0")))
+        return FAKE_WORKSHEET
+
+# =============================== 書き込みスループット計測 ===============================
+# python sheet_writer.py --rows 5000 --threads 16 --latency 0.3
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Outbox と SheetWriter の書き込み性能を FakeWorksheet で測る")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.3, help="append_rows 1回あたりの疑似遅延（秒）")
+    parser.add_argument("--synchronous", default="FULL")
+    args = parser.parse_args(argv)
+
+    ws = FakeWorksheet(args.latency)
+    with tempfile.TemporaryDirectory() as tmp:
+        outbox = Outbox(os.path.join(tmp, "outbox.sqlite3"), args.synchronous)
+        writer = SheetWriter(lambda: ws, outbox, interval=0.5)
+
+        def submit(worker):
+            for i in range(worker, args.rows, args.threads):
+                writer.put(f"bench-{i}", ["bench", i, "あまい", 3, 1.25])
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=submit, args=(k,)) for k in range(args.threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        stored = time.perf_counter() - start
+        writer.close()
+        drained = time.perf_counter() - start
+        outbox.close()
+
+    print(json.dumps({
+        "rows": args.rows,
+        "outbox_rows_per_sec": round(args.rows / stored, 1),
+        "drain_seconds": round(drained, 3),
+        "sheet_rows": len(ws.rows),
+        "sheet_calls": len(ws.calls),
+        "duplicates": len(ws.rows) - len({row[-1] for row in ws.rows}),
+    }))
+
+
+if __name__ == "__main__":
+    main()
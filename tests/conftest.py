@@ -0,0 +1,54 @@
+import os
+import random
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from vowel_engine import VowelIndex, load_dict  # noqa: E402
+
+# =============================== テスト用の辞書 ===============================
+# 実際の romaji_words.txt と、長音（-）・「ん」（n / nn）・拗音を多めに混ぜた合成辞書の2つで確かめる
+
+SYLLABLES = ["ka", "n", "nn", "a", "-", "shi", "tsu", "ne", "ho", "mu", "ri", "u", "e", "o", "gya", "pi"]
+DOMAINS = [("taste",), ("body",), ("general",), ("taste", "body"), ("talk",)]
+
+
+def synthetic_dict(size, seed=0):
+    rnd = random.Random(seed)
+    words, domains = {}, {}
+    while len(words) < size:
+        r = "".join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(1, 6)))
+        if r[0] == "-":
+            continue
+        words[r] = r.upper()
+        domains[r] = set(rnd.choice(DOMAINS))
+    return words, domains
+
+
+def random_patterns(count, seed=0, max_len=8):
+    rnd = random.Random(seed)
+    return ["".join(rnd.choice("aiueo") for _ in range(rnd.randint(1, max_len))) for _ in range(count)]
+
+
+@pytest.fixture(scope="session")
+def word_index():
+    domains = {}
+    return VowelIndex(load_dict(os.path.join(ROOT, "romaji_words.txt"), domains=domains), domains)
+
+
+@pytest.fixture(scope="session")
+def synthetic_index():
+    return VowelIndex(*synthetic_dict(3000))
+
+
+@pytest.fixture(params=["words", "synthetic"])
+def index(request, word_index, synthetic_index):
+    return word_index if request.param == "words" else synthetic_index
+
+
+@pytest.fixture(params=[None, ("taste", "general"), ("body",)], ids=["all", "taste+general", "body"])
+def mask(request, index):
+    return None if request.param is None else index.domain_mask(request.param)
@@ -0,0 +1,43 @@
+import os
+from collections import Counter
+
+from conftest import ROOT
+from question_flow import QUESTIONS
+from vowel_engine import GENERAL, IncrementalMatcher, load_dict
+
+# =============================== romaji_words.txt ===============================
+# 並び順は同順位の候補の並びを決めるので、語を動かさずに分類だけを付ける
+
+PATH = os.path.join(ROOT, "romaji_words.txt")
+KNOWN_DOMAINS = {GENERAL, "taste", "body", "talk", "daily"}
+
+
+def test_every_line_loads_once():
+    errors = []
+    load_dict(PATH, errors)
+    assert errors == []
+    with open(PATH, encoding="utf-8") as f:
+        romaji = Counter(line.split(",")[0] for line in f if line.strip())
+    assert [r for r, n in romaji.items() if n > 1] == []
+
+
+def test_domains_are_known_and_split_the_questions():
+    domains = {}
+    load_dict(PATH, domains=domains)
+    assert set().union(*domains.values()) <= KNOWN_DOMAINS
+    taste, body = (set(q["domains"]) for q in QUESTIONS)
+    # あいさつ・返事（talk）や身の回りの語（daily）はどちらの質問にも出さない
+    assert {"talk", "daily"}.isdisjoint(taste | body)
+    assert domains["hai"] == {"talk"}
+    assert domains["nemui"] == {"body"}
+    assert domains["kusai"] == {"taste"}
+
+
+def test_same_tier_keeps_dictionary_order(word_index):
+    # 「ねむい」は辞書の前のほうにあるので、同じ段階の「げんき」より上に出る
+    body = word_index.domain_mask(QUESTIONS[1]["domains"])
+    matcher = IncrementalMatcher(word_index, 0, None, body)
+    for ch in "eui":
+        matcher.push(ch)
+    top = [j for _, j, _ in matcher.ranked().top(3)]
+    assert top.index("眠い") < top.index("元気")
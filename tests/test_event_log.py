@@ -0,0 +1,70 @@
+from event_log import EventLog, read_events, write_events
+
+# =============================== 打鍵ログ ===============================
+
+
+def test_server_events_are_relative_to_start():
+    log = EventLog(("taste", "body"))
+    log.start(1, t_ns=5_000_000_000)
+    log.add(1, "tap", "a", t_ns=5_250_000_000)
+    log.add(1, "select", "あまい", t_ns=6_000_500_000)
+    columns = log.columns()
+    assert columns["question"] == ["body", "body", "body"]
+    assert columns["kind"] == ["start", "tap", "select"]
+    assert columns["value"] == ["", "a", "あまい"]
+    assert columns["t_ms"] == [0.0, 250.0, 1000.5]
+
+
+def test_client_events_keep_browser_times():
+    # ブラウザの start が起点になり、t_ms はブラウザで測った値のまま残る
+    log = EventLog(("taste", "body"))
+    log.start(0)
+    log.add(0, "tap", "a")
+    log.add_client(1, [["start", "", 0], ["tap", "e", 512.25], ["impression", "x|y", 513.5],
+                       ["select", "x", 2048.125], ["unknown", "", 3000]])
+    columns = log.columns()
+    body = [(k, v, t) for q, k, v, t in zip(columns["question"], columns["kind"], columns["value"], columns["t_ms"])
+            if q == "body"]
+    assert body == [("start", "", 0.0), ("tap", "e", 512.25), ("impression", "x|y", 513.5), ("select", "x", 2048.125)]
+    assert columns["kind"][:2] == ["start", "tap"]
+
+
+def test_impression_only_when_shown_words_change():
+    log = EventLog(("taste",))
+    log.start(0)
+    log.impression(0, ["a", "b"])
+    log.impression(0, ["a", "b"])
+    log.impression(0, [])
+    log.impression(0, ["a", "b"])
+    assert log.columns()["kind"] == ["start", "impression", "impression"]
+
+
+def test_overflow_is_counted_not_stored():
+    log = EventLog(("taste",), capacity=4)
+    log.add(0, "tap", "a")  # start 前の記録は残らない
+    log.start(0)
+    for ch in "aiueo":
+        log.add(0, "tap", ch)
+    columns = log.columns()
+    assert columns["kind"] == ["start", "tap", "tap", "tap"]
+    assert columns["value"] == ["", "a", "i", "u"]
+    assert columns["dropped"] == 3  # start 前の1件 + あふれた2件
+
+
+def test_empty_log_has_no_buffers():
+    log = EventLog(("taste", "body"))
+    assert log.origin is None and log.shown is None
+    assert log.columns() == {"question": [], "kind": [], "value": [], "t_ms": [], "dropped": 0}
+
+
+def test_write_and_read_back(tmp_path):
+    path = str(tmp_path / "keystrokes.jsonl")
+    for sid in ("s1", "s2"):
+        log = EventLog(("taste",))
+        log.start(0, t_ns=0)
+        log.add(0, "tap", sid, t_ns=1_000_000)
+        write_events(path, sid, log)
+    events = read_events(path)
+    assert events["submission_id"] == ["s1", "s1", "s2", "s2"]
+    assert events["value"] == ["", "s1", "", "s2"]
+    assert events["t_ms"] == [0.0, 1.0, 0.0, 1.0]
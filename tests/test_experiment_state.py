@@ -0,0 +1,50 @@
+import time
+
+from experiment_state import ExperimentState, VowelAnswer, YesNoAnswer
+from question_flow import ANSWER_KINDS, QUESTION_NAMES
+
+# =============================== 1セッション分の状態 ===============================
+
+
+def test_reset_starts_a_new_participant():
+    state = ExperimentState(ANSWER_KINDS, QUESTION_NAMES)
+    first_id = state.submission_id
+    state.phase = "survey"
+    state.experiment_id = "nick"
+    state.saved = True
+    state.answers[0].result = "あまい"
+    state.events.start(0)
+    old_answers = state.answers
+
+    state.reset()
+    assert state.phase == "id_input"
+    assert state.experiment_id == ""
+    assert state.saved is False
+    assert state.submission_id != first_id
+    assert state.answers is not old_answers
+    assert [type(a) for a in state.answers] == [VowelAnswer if k == "vowel" else YesNoAnswer for k in ANSWER_KINDS]
+    assert all(a.result is None for a in state.answers)
+    assert state.events.size == 0
+
+
+def test_records_have_no_instance_dict():
+    state = ExperimentState(ANSWER_KINDS, QUESTION_NAMES)
+    for obj in [state, state.events, *state.answers]:
+        assert not hasattr(obj, "__dict__"), type(obj).__name__
+
+
+def test_duration():
+    answer = YesNoAnswer()
+    assert answer.duration() == ""
+    answer.time_start, answer.time_end = 10.0, 12.345
+    assert answer.duration() == 2.35
+    # 終わっていなければ今までの時間
+    answer.time_start, answer.time_end = time.time() - 1.0, None
+    assert 1.0 <= answer.duration() < 2.0
+
+
+def test_yesno_start_resets_progress():
+    answer = YesNoAnswer()
+    answer.index, answer.steps = 3, 4
+    answer.start(["a", "b"])
+    assert (answer.items, answer.index, answer.steps) == (["a", "b"], 0, 0)
@@ -0,0 +1,61 @@
+import json
+import os
+import random
+import shutil
+import subprocess
+
+import pytest
+
+from conftest import ROOT
+from vowel_engine import IncrementalMatcher
+
+# =============================== ブラウザ側キーパッドとの一致 ===============================
+# vowel_keypad/matcher.js の Matcher を node で動かし、同じ打鍵列で
+# IncrementalMatcher + RankedCandidates と同じ候補が同じ順に並ぶことを確かめる
+
+NODE = shutil.which("node")
+
+RUN_CASES = """
+const { Matcher } = require(process.argv[1]);
+const data = JSON.parse(require("fs").readFileSync(process.argv[2], "utf-8"));
+const result = data.cases.map((c) => {
+  const matcher = new Matcher(data.index, c.max_distance, c.popularity, c.mask);
+  return c.keys.map((key) => {
+    if (key === "DEL") matcher.pop(); else matcher.push(key);
+    return matcher.ranked();
+  });
+});
+process.stdout.write(JSON.stringify(result));
+"""
+
+
+def python_ranked(index, keys, max_distance, popularity, mask):
+    position = {id(entry): i for i, entry in enumerate(index.entries)}
+    matcher = IncrementalMatcher(index, max_distance, popularity, mask)
+    result = []
+    for key in keys:
+        if key == "DEL":
+            matcher.pop()
+        else:
+            matcher.push(key)
+        ranked = matcher.ranked()
+        result.append([position[id(entry)] for page in range(ranked.page_count()) for entry in ranked.page(page)])
+    return result
+
+
+@pytest.mark.skipif(NODE is None, reason="node が無い")
+def test_matcher_js_matches_python(index, mask, tmp_path):
+    rnd = random.Random(21)
+    cases = []
+    for _ in range(150):
+        keys = ["DEL" if rnd.random() < 0.2 else rnd.choice("aiueo") for _ in range(rnd.randint(1, 9))]
+        popularity = {j: rnd.randint(1, 5) for _, j, _ in index.entries if rnd.random() < 0.2} or None
+        cases.append({"keys": keys, "max_distance": rnd.choice((0, 2)), "popularity": popularity, "mask": mask})
+    path = tmp_path / "cases.json"
+    path.write_text(json.dumps({"index": index.compiled(), "cases": cases}, ensure_ascii=False), encoding="utf-8")
+
+    matcher_js = os.path.join(ROOT, "vowel_keypad", "matcher.js")
+    out = subprocess.run([NODE, "-e", RUN_CASES, matcher_js, str(path)], capture_output=True, text=True, check=True)
+    for case, ranked in zip(cases, json.loads(out.stdout)):
+        assert ranked == python_ranked(index, case["keys"], case["max_distance"], case["popularity"], case["mask"]), \
+            case["keys"]
@@ -0,0 +1,42 @@
+import metrics
+from metrics import BUCKETS, PREFIX, Registry
+
+# =============================== ヒストグラムと出力 ===============================
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    for seconds in (0.0001, 0.003, 0.003, 100.0):
+        registry.observe("rerun", seconds, phase="id_input")
+    lines = registry.render().splitlines()
+    metric = f"{PREFIX}rerun_seconds"
+    assert f"# TYPE {metric} histogram" in lines
+    buckets = [line for line in lines if line.startswith(metric + "_bucket")]
+    assert len(buckets) == len(BUCKETS) + 1
+    assert buckets[0] == f'{metric}_bucket{{phase="id_input",le="{BUCKETS[0]!r}"}} 1'
+    assert buckets[BUCKETS.index(0.005)].endswith(" 3")
+    assert buckets[-1] == f'{metric}_bucket{{phase="id_input",le="+Inf"}} 4'
+    assert f'{metric}_count{{phase="id_input"}} 4' in lines
+
+
+def test_counters_and_label_escaping():
+    registry = Registry()
+    registry.inc("sheets_rows", 3)
+    registry.inc("sheets_rows", 2)
+    registry.inc("sheets_errors", status='say "hi"\n')
+    text = registry.render()
+    assert f"{PREFIX}sheets_rows_total 5" in text
+    assert f'{PREFIX}sheets_errors_total{{status="say \\"hi\\"\\n"}} 1' in text
+
+
+def test_timer_and_timed_record_once_per_call():
+    @metrics.timed("unit_test_call", kind="decorated")
+    def work(x):
+        return x * 2
+
+    key = ("unit_test_call", (("kind", "decorated"),))
+    before = metrics.REGISTRY.histograms[key].count if key in metrics.REGISTRY.histograms else 0
+    assert work(21) == 42
+    with metrics.timer("unit_test_call", kind="decorated"):
+        pass
+    assert metrics.REGISTRY.histograms[key].count == before + 2
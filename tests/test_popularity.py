@@ -0,0 +1,65 @@
+import time
+
+from popularity import EMPTY, PopularityTable, aggregate
+from question_flow import result_columns
+from sheet_writer import FakeWorksheet
+from vowel_engine import RankedCandidates
+
+# =============================== 集計 ===============================
+
+
+def test_aggregate_counts_each_question_column():
+    columns = {"taste": 1, "body": 3}
+    rows = [
+        ["nick", "あまい", "x", "ねむい"],
+        ["nick", "あまい", "x", ""],
+        ["nick", "からい"],  # 途中で切れた行
+        ["nick", "", "x", "ねむい"],
+    ]
+    assert aggregate(rows, columns) == {"taste": {"あまい": 2, "からい": 1}, "body": {"ねむい": 2}}
+
+
+def test_aggregate_uses_sheet_columns():
+    row = [""] * 21
+    row[5], row[14] = "あまい", "げんき"
+    assert aggregate([row], result_columns()) == {"taste": {"あまい": 1}, "body": {"げんき": 1}}
+
+# =============================== 表の更新と期限 ===============================
+
+
+def wait_loaded(table, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while table.loaded_at is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_table_refreshes_in_background_and_expires():
+    ws = FakeWorksheet()
+    ws.append_rows([["nick", "あまい"], ["nick", "あまい"]])
+    table = PopularityTable(lambda: ws, {"taste": 1}, interval=3600.0, ttl=60.0)
+    wait_loaded(table)
+    assert table.get("taste") == {"あまい": 2}
+    assert table.get("body") is EMPTY
+    assert table.version == 1
+    # 最後の集計から ttl を過ぎたら、回数なしの並びに戻す
+    table.loaded_at -= 61.0
+    assert table.get("taste") is EMPTY
+
+
+def test_failed_refresh_keeps_empty_table():
+    def broken():
+        raise ConnectionError("sheets down")
+
+    table = PopularityTable(broken, {"taste": 1}, interval=3600.0)
+    time.sleep(0.05)
+    assert table.loaded_at is None
+    assert table.get("taste") is EMPTY
+
+# =============================== 並べ替え ===============================
+
+
+def test_popularity_orders_within_a_tier_only():
+    candidates = [("amai", "あまい", "aai"), ("karai", "からい", "aai"), ("aa", "ああ", "aa"), ("kanai", "かない", "aai")]
+    ranked = RankedCandidates(candidates, "aai", popularity={"かない": 5, "からい": 2, "ああ": 99})
+    # 完全一致の段階の中だけが回数順になり、長さの違う「ああ」は回数が多くても上がらない
+    assert [j for _, j, _ in ranked.top(4)] == ["かない", "からい", "あまい", "ああ"]
@@ -0,0 +1,62 @@
+from experiment_state import ExperimentState, VowelAnswer, YesNoAnswer
+from question_flow import ANSWER_KINDS, FIRST_PHASE, FLOW, LAST_PHASE, QUESTION_NAMES, result_columns, sheet_row
+
+# =============================== シートの1行 ===============================
+# フェーズ表から作った行が、以前の（質問を if/elif で並べていた）版と同じ21列・同じ並びになる
+
+
+def populated_state():
+    state = ExperimentState(ANSWER_KINDS, QUESTION_NAMES)
+    state.experiment_id = "nick"
+    state.age_group = "20代"
+    state.vowel_ui_eval = "例を見ればすぐ理解できた"
+    for phase in FLOW.values():
+        if phase.answer is None:
+            continue
+        answer = state.answers[phase.answer]
+        prefix = f"{phase.question['name']}_{phase.step['kind']}"
+        answer.result = prefix + "_result"
+        answer.free_text = prefix + "_free"
+        answer.steps = len(prefix)
+        answer.time_start, answer.time_end = 100.0, 101.5
+        if isinstance(answer, VowelAnswer):
+            answer.deletes = 2
+    return state
+
+
+def test_sheet_row_keeps_baseline_columns():
+    assert sheet_row(populated_state()) == [
+        "nick",
+        # 味覚 YES/NO：結果, 自由入力, 回数, 時間
+        "taste_yesno_result", "taste_yesno_free", len("taste_yesno"), 1.5,
+        # 味覚 母音：結果, 自由入力, 打鍵数, 削除数, 時間
+        "taste_vowel_result", "taste_vowel_free", len("taste_vowel"), 2, 1.5,
+        # 体調 YES/NO
+        "body_yesno_result", "body_yesno_free", len("body_yesno"), 1.5,
+        # 体調 母音
+        "body_vowel_result", "body_vowel_free", len("body_vowel"), 2, 1.5,
+        "20代", "例を見ればすぐ理解できた",
+    ]
+
+
+def test_result_columns_point_at_vowel_results():
+    assert result_columns() == {"taste": 5, "body": 14}
+    row = sheet_row(populated_state())
+    assert len(row) == 21
+    assert row[5] == "taste_vowel_result"
+    assert row[14] == "body_vowel_result"
+
+# =============================== フェーズ表 ===============================
+
+
+def test_flow_visits_every_step_in_order():
+    names = []
+    phase = FLOW[FIRST_PHASE]
+    while phase.name != LAST_PHASE:
+        names.append(phase.name)
+        phase = FLOW[phase.done]
+    assert names == [FIRST_PHASE, "taste_vowel_intro", "taste_yesno_intro", "body_vowel_intro", "body_yesno_intro"]
+    for phase in FLOW.values():
+        if phase.answer is not None:
+            expected = VowelAnswer if phase.step["kind"] == "vowel" else YesNoAnswer
+            assert isinstance(ExperimentState(ANSWER_KINDS, QUESTION_NAMES).answers[phase.answer], expected)
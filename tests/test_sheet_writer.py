@@ -0,0 +1,137 @@
+import sqlite3
+import time
+
+import pytest
+
+from sheet_writer import FakeWorksheet, Outbox, SheetWriter
+
+# =============================== Outbox ===============================
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "outbox.sqlite3")
+
+
+def test_duplicate_add_is_ignored(path):
+    outbox = Outbox(path)
+    outbox.add("s1", ["a", 1])
+    outbox.add("s1", ["b", 2])
+    assert outbox.pending_count() == 1
+    assert outbox.claim(10) == [("s1", ["a", 1])]
+
+
+def test_two_owners_never_claim_the_same_row(path):
+    a, b = Outbox(path), Outbox(path)
+    for i in range(10):
+        a.add(f"s{i}", [i])
+    first, second, third = a.claim(4), b.claim(4), a.claim(4)
+    ids = [sid for sid, _ in first + second]
+    assert len(ids) == len(set(ids)) == 8
+    # 自分が取った行は取り直せる（送れなかった分の再送）が、相手の行は取らない
+    assert third == first
+    assert [sid for sid, _ in b.claim(6)] == [sid for sid, _ in second] + ["s8", "s9"]
+
+
+def test_expired_claim_is_taken_over(path):
+    a, b = Outbox(path, claim_ttl=0.05), Outbox(path, claim_ttl=0.05)
+    a.add("s1", [1])
+    assert a.claim(10) == [("s1", [1])]
+    assert b.claim(10) == []
+    time.sleep(0.1)
+    assert b.claim(10) == [("s1", [1])]
+
+
+def test_failed_rows_are_not_claimed(path):
+    outbox = Outbox(path)
+    outbox.add("s1", [1])
+    outbox.add("s2", [2])
+    outbox.mark_failed(["s1"], "HTTPError: 400")
+    assert outbox.claim(10) == [("s2", [2])]
+    assert outbox.pending_count() == 1
+    assert outbox.failed_count() == 1
+
+# =============================== SheetWriter ===============================
+
+
+def test_writer_sends_each_row_once(path):
+    ws = FakeWorksheet()
+    writer = SheetWriter(lambda: ws, Outbox(path), interval=0.01)
+    for i in range(25):
+        writer.put(f"s{i}", ["row", i])
+    writer.close()
+    assert sorted(row[-1] for row in ws.rows) == sorted(f"s{i}" for i in range(25))
+    assert writer.outbox.pending_count() == 0
+
+
+def test_writer_batches_rows(path):
+    # 短い間にたまった行は batch_size 行ずつの append_rows にまとまる
+    ws = FakeWorksheet(latency=0.02)
+    writer = SheetWriter(lambda: ws, Outbox(path), interval=0.05, batch_size=10)
+    for i in range(40):
+        writer.put(f"s{i}", ["row", i])
+    writer.close()
+    sizes = [n for _, n in ws.calls]
+    assert sum(sizes) == 40
+    assert max(sizes) <= 10
+    assert len(sizes) < 40
+    assert writer.batches == len(sizes)
+    assert writer.rows == 40
+
+
+def test_replay_skips_rows_already_in_the_sheet(path):
+    # 前のプロセスが append_rows したあと、送信済みにする前に落ちた
+    ws = FakeWorksheet()
+    outbox = Outbox(path)
+    for i in range(3):
+        outbox.add(f"s{i}", ["row", i, f"s{i}"])
+    ws.append_rows([["row", 0, "s0"], ["row", 1, "s1"]])
+    writer = SheetWriter(lambda: ws, Outbox(path), interval=0.01)
+    writer.close()
+    assert [row[-1] for row in ws.rows] == ["s0", "s1", "s2"]
+    assert outbox.pending_count() == 0
+
+
+def test_non_retryable_error_parks_the_rows(path):
+    class BadRequest(Exception):
+        class response:
+            status_code = 400
+
+    class RejectingWorksheet(FakeWorksheet):
+        def append_rows(self, values, value_input_option=None):
+            if any(row[0] == "bad" for row in values):
+                raise BadRequest("invalid value")
+            super().append_rows(values, value_input_option)
+
+    ws = RejectingWorksheet()
+    outbox = Outbox(path)
+    writer = SheetWriter(lambda: ws, outbox, interval=0.01, batch_size=1)
+    writer.put("s1", ["bad"])
+    writer.put("s2", ["good"])
+    writer.close()
+    assert [row[-1] for row in ws.rows] == ["s2"]
+    assert outbox.failed_count() == 1
+    assert outbox.pending_count() == 0
+
+
+def test_writer_survives_outbox_errors(path):
+    outbox = Outbox(path)
+    claim = outbox.claim
+    calls = []
+
+    def flaky_claim(limit):
+        calls.append(limit)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return claim(limit)
+
+    outbox.claim = flaky_claim
+    ws = FakeWorksheet()
+    writer = SheetWriter(lambda: ws, outbox, interval=0.01)
+    writer.put("s1", ["row"])
+    deadline = time.monotonic() + 5
+    while not ws.rows and time.monotonic() < deadline:
+        time.sleep(0.05)
+    writer.close()
+    assert [row[-1] for row in ws.rows] == ["s1"]
+    assert writer.errors == 1
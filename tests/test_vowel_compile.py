@@ -0,0 +1,103 @@
+import random
+
+import pytest
+
+from conftest import random_patterns
+from vowel_compile import HEADER, MAGIC, OPEN_ERRORS, compile_index, kana_to_romaji, open_index
+from vowel_engine import IncrementalMatcher
+
+# =============================== mmap した索引 ===============================
+# MappedIndex は VowelIndex と同じ語番号・同じ結果を返す
+
+
+@pytest.fixture
+def mapped(index, tmp_path):
+    path = str(tmp_path / "words.idx")
+    compile_index(index, path, {"words.txt": "digest"})
+    mapped = open_index(path)
+    yield mapped
+    mapped.close()
+
+
+def test_mapped_entries_and_meta(index, mapped):
+    assert len(mapped.entries) == len(index.entries)
+    assert list(mapped.entries) == index.entries
+    assert list(mapped.masks) == list(index.masks)
+    assert mapped.domain_bits == index.domain_bits
+    assert mapped.meta["sources"] == {"words.txt": "digest"}
+    assert mapped.compiled() == index.compiled()
+    assert bytes(mapped.compiled_json()) == index.compiled_json()
+
+
+def test_mapped_lookup_matches_index(index, mapped, mask):
+    for pattern in random_patterns(300, seed=11):
+        assert mapped.lookup_ids(pattern, mask) == index.lookup_ids(pattern, mask), pattern
+
+
+def test_mapped_fuzzy_matches_index(index, mapped, mask):
+    for pattern in random_patterns(100, seed=12):
+        for max_distance in (1, 2):
+            assert mapped.fuzzy_ids(pattern, max_distance, mask) == index.fuzzy_ids(pattern, max_distance, mask), \
+                (pattern, max_distance)
+
+
+def test_mapped_incremental_matcher(index, mapped, mask):
+    rnd = random.Random(13)
+    for _ in range(60):
+        a = IncrementalMatcher(index, 2, None, mask)
+        b = IncrementalMatcher(mapped, 2, None, mask)
+        for _ in range(rnd.randint(1, 9)):
+            if a.pattern and rnd.random() < 0.25:
+                a.pop()
+                b.pop()
+            else:
+                ch = rnd.choice("aiueo")
+                a.push(ch)
+                b.push(ch)
+            assert b.candidates == a.candidates, a.pattern
+            ra, rb = a.ranked(), b.ranked()
+            assert rb.page_count() == ra.page_count()
+            assert rb.page(0) == ra.page(0), a.pattern
+
+
+def test_open_rejects_other_files(tmp_path):
+    path = tmp_path / "bad.idx"
+    path.write_bytes(HEADER.pack(b"NOTVOWEL", 1, 0) + b"\0" * 8)
+    with pytest.raises(ValueError):
+        open_index(str(path))
+    path.write_bytes(HEADER.pack(MAGIC, 0, 0) + b"\0" * 8)
+    with pytest.raises(ValueError):
+        open_index(str(path))
+
+
+def test_open_rejects_truncated_file(word_index, tmp_path):
+    path = str(tmp_path / "words.idx")
+    compile_index(word_index, path)
+    with open(path, "rb") as f:
+        data = f.read()
+    for size in (0, HEADER.size - 1, HEADER.size + 10, len(data) // 2):
+        with open(path, "wb") as f:
+            f.write(data[:size])
+        with pytest.raises(OPEN_ERRORS):
+            open_index(path)
+
+# =============================== かな -> ローマ字 ===============================
+
+
+@pytest.mark.parametrize("kana, romaji", [
+    ("こってり", "kotteri"),
+    ("しょっぱい", "shoppai"),
+    ("あまずっぱい", "amazuppai"),
+    ("ジュース", "ju-su"),
+    ("かふんしょう", "kafunnshou"),
+    ("きゃっち", "kyacchi"),
+    ("ふぁみりー", "famiri-"),
+    ("うぃるす", "wirusu"),
+    ("まっちゃ", "maccha"),
+    ("いっしょ", "issho"),
+    ("ティッシュ", "tisshu"),
+    ("っ", None),
+    ("漢字", None),
+])
+def test_kana_to_romaji(kana, romaji):
+    assert kana_to_romaji(kana) == romaji
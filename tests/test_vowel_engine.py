@@ -0,0 +1,110 @@
+import random
+
+from conftest import random_patterns
+from vowel_engine import IncrementalMatcher, RankedCandidates, match_pattern, sort_key
+
+# =============================== 参照実装 ===============================
+# 索引を使わず、辞書の全語を1つずつ比べる（遅いが定義そのもの）
+
+
+def scan_ids(index, pattern, mask=None):
+    return [i for i, (r, _, v) in enumerate(index.entries)
+            if match_pattern(v, pattern, r) and (mask is None or index.masks[i] & mask)]
+
+
+def edit_distance(pattern, word):
+    # 「う」=「u/n」を一致とみなす編集距離
+    prev = list(range(len(pattern) + 1))
+    for k, ch in enumerate(word, 1):
+        cur = [k]
+        for i, p in enumerate(pattern, 1):
+            cost = 0 if ch == p or (p == "u" and ch == "n") else 1
+            cur.append(min(prev[i] + 1, cur[i - 1] + 1, prev[i - 1] + cost))
+        prev = cur
+    return prev[len(pattern)]
+
+
+def fuzzy_distance(romaji, vowels, pattern):
+    # vowel_engine の「あいまい一致」の定義どおり
+    if "-" in romaji:
+        return min(edit_distance(pattern, vowels), edit_distance(pattern, vowels[:-1]) if vowels else len(pattern),
+                   edit_distance(pattern[:-1], vowels))
+    return min(edit_distance(pattern, vowels[:k]) for k in range(len(vowels) + 1))
+
+
+def fuzzy_distances(index, pattern):
+    return [fuzzy_distance(r, v, pattern) for r, _, v in index.entries]
+
+# =============================== 完全一致 ===============================
+
+
+def test_lookup_matches_scan(index, mask):
+    for pattern in random_patterns(300, seed=1):
+        assert index.lookup_ids(pattern, mask) == scan_ids(index, pattern, mask), pattern
+
+
+def test_lookup_empty_pattern(index):
+    assert index.lookup_ids("") == []
+
+
+def test_distance_zero_is_exact_match(index):
+    for pattern in random_patterns(30, seed=2):
+        exact = [i for i, d in enumerate(fuzzy_distances(index, pattern)) if d == 0]
+        assert exact == index.lookup_ids(pattern), pattern
+
+# =============================== あいまい一致 ===============================
+
+
+def test_fuzzy_matches_edit_distance(index):
+    # 参照の距離は分類によらないので、1つの入力について1回だけ計算して各分類・各距離で比べる
+    masks = [None, index.domain_mask(("taste", "general")), index.domain_mask(("body",))]
+    for pattern in random_patterns(40, seed=3):
+        distances = fuzzy_distances(index, pattern)
+        for mask in masks:
+            for max_distance in (1, 2):
+                expected = [(i, d) for i, d in enumerate(distances)
+                            if 0 < d <= max_distance and (mask is None or index.masks[i] & mask)]
+                assert index.fuzzy_ids(pattern, max_distance, mask) == expected, (pattern, mask, max_distance)
+
+
+def test_fuzzy_without_budget(index):
+    assert index.fuzzy_ids("aiu", 0) == []
+    assert index.fuzzy_ids("", 2) == []
+
+# =============================== 1打鍵ずつの絞り込み ===============================
+
+
+def test_incremental_matcher_follows_lookup(index, mask):
+    rnd = random.Random(4)
+    for _ in range(100):
+        matcher = IncrementalMatcher(index, 2, None, mask)
+        for _ in range(rnd.randint(1, 10)):
+            if matcher.pattern and rnd.random() < 0.25:
+                matcher.pop()
+            else:
+                matcher.push(rnd.choice("aiueo"))
+            expected = [index.entries[i] for i in index.lookup_ids(matcher.pattern, mask)]
+            assert matcher.candidates == expected, matcher.pattern
+
+
+def test_ranked_pages_follow_sort_key(index):
+    for pattern in random_patterns(100, seed=5):
+        candidates = index.lookup(pattern)
+        ranked = RankedCandidates(candidates, pattern)
+        pages = [e for page in range(ranked.page_count()) for e in ranked.page(page)]
+        assert pages == sorted(candidates, key=lambda item: sort_key(item, pattern)), pattern
+
+
+def test_ranked_by_ids_matches_entries(index, mask):
+    # IncrementalMatcher は語番号で順位を付ける。(ローマ字, 表記, 母音列) で並べたときと同じになる
+    rnd = random.Random(6)
+    for pattern in random_patterns(60, seed=6):
+        popularity = {j: rnd.randint(0, 3) for _, j, _ in index.entries if rnd.random() < 0.3}
+        ids = index.lookup_ids(pattern, mask)
+        fuzzy = index.fuzzy_ids(pattern, 1, mask)
+        by_entry = RankedCandidates([index.entries[i] for i in ids], pattern,
+                                    [(index.entries[i], d) for i, d in fuzzy], popularity)
+        by_id = RankedCandidates(ids, pattern, fuzzy, popularity, index)
+        assert by_id.page_count() == by_entry.page_count()
+        for page in range(by_entry.page_count()):
+            assert by_id.page(page) == by_entry.page(page), (pattern, page)
@@ -0,0 +1,37 @@
+import pytest
+
+from conftest import random_patterns
+from vowel_engine import RankedCandidates
+
+np = pytest.importorskip("numpy")
+
+from vowel_numpy import VectorIndex, python_rank  # noqa: E402
+
+# =============================== NumPy 一括照合 ===============================
+# VectorIndex.rank は VowelIndex + RankedCandidates と同じ件数・同じ並びを返す
+
+
+def all_ranked(index, patterns):
+    position = {id(entry): i for i, entry in enumerate(index.entries)}
+    results = []
+    for pattern in patterns:
+        ranked = RankedCandidates(index.lookup(pattern), pattern)
+        results.append((ranked.total, [position[id(e)] for page in range(ranked.page_count())
+                                       for e in ranked.page(page)]))
+    return results
+
+
+def test_rank_top_matches_ranked_candidates(index):
+    patterns = random_patterns(300, seed=31) + [""]
+    assert VectorIndex(index).rank(patterns, 6) == python_rank(index, patterns, 6)
+
+
+def test_rank_all_matches_ranked_candidates(index):
+    patterns = random_patterns(100, seed=32)
+    assert VectorIndex(index).rank(patterns, None) == all_ranked(index, patterns)
+
+
+def test_rank_in_small_chunks(index):
+    # 入力を数件ずつに分けて計算しても結果は変わらない
+    patterns = random_patterns(50, seed=33)
+    assert VectorIndex(index, chunk_cells=len(index.entries) * 3).rank(patterns) == python_rank(index, patterns, 6)
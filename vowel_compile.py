@@ -0,0 +1,430 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+
+from vowel_engine import GENERAL, VowelIndex, load_dict
+
+# =============================== 辞書のコンパイル ===============================
+# romaji_words.txt（と、かなの単語リスト）を、起動時に解析しなくてよい1つのバイナリファイルにする。
+# ファイルには母音抽出済みの母音列・長音フラグ・母音数・分類ビット・文字列表と、
+# 母音列の辞書順に並べた語番号（前方一致の索引）が入っていて、アプリは mmap するだけで使える。
+# 同じホストの複数プロセスはページキャッシュ上の同じ1部を共有し、辞書が数十万語でもすぐ起動する。
+#   python vowel_compile.py romaji_words.txt -o romaji_words.idx
+#   python vowel_compile.py romaji_words.txt --kana words_kana.csv -o romaji_words.idx
+
+MAGIC = b"VOWELIDX"
+VERSION = 2
+HEADER = struct.Struct("<8sII")  # MAGIC, VERSION, メタ情報（JSON）のバイト数
+ALIGN = 8
+
+# =============================== かな -> ローマ字 ===============================
+# romaji_words.txt の書き方に合わせる：「ん」は nn、「ー」は -、小さい「っ」は次の子音を重ねる。
+# 長音をかなで書いた「おう」「いい」などは、かなのまま ou / ii にする
+KANA = dict(pair.split(":") for pair in (
+    "あ:a い:i う:u え:e お:o か:ka き:ki く:ku け:ke こ:ko さ:sa し:shi す:su せ:se そ:so "
+    "た:ta ち:chi つ:tsu て:te と:to な:na に:ni ぬ:nu ね:ne の:no は:ha ひ:hi ふ:fu へ:he ほ:ho "
+    "ま:ma み:mi む:mu め:me も:mo や:ya ゆ:yu よ:yo ら:ra り:ri る:ru れ:re ろ:ro わ:wa を:wo ん:nn "
+    "が:ga ぎ:gi ぐ:gu げ:ge ご:go ざ:za じ:ji ず:zu ぜ:ze ぞ:zo だ:da ぢ:ji づ:zu で:de ど:do "
+    "ば:ba び:bi ぶ:bu べ:be ぼ:bo ぱ:pa ぴ:pi ぷ:pu ぺ:pe ぽ:po ゔ:vu ー:-"
+).split())
+SMALL_Y = {"ゃ": "a", "ゅ": "u", "ょ": "o"}
+SMALL_VOWEL = {"ぁ": "a", "ぃ": "i", "ぅ": "u", "ぇ": "e", "ぉ": "o", "ゎ": "a"}
+
+
+def kana_to_romaji(kana):
+    # ひらがな・カタカナの読み -> ローマ字。変換できない文字があれば None
+    syllables = []
+    double = False
+    for ch in kana:
+        if "ァ" <= ch <= "ヶ":
+            ch = chr(ord(ch) - 0x60)
+        if ch in ("っ", "ッ"):
+            double = True
+            continue
+        if ch in SMALL_Y and syllables and syllables[-1].endswith("i") and len(syllables[-1]) > 1:
+            # きゃ -> kya、しゃ -> sha、ちゃ -> cha、じゃ -> ja（っちゃ -> ccha、っしょ -> ssho も同じ）
+            base = syllables[-1][:-1]
+            syllables[-1] = base + ("" if base.endswith(("sh", "ch", "j")) else "y") + SMALL_Y[ch]
+        elif ch in SMALL_VOWEL and syllables and syllables[-1][-1] in "aiueo":
+            # ふぁ -> fa、てぃ -> ti、ちぇ -> che、うぃ -> wi
+            base = syllables[-1][:-1] or "w"
+            syllables[-1] = base + SMALL_VOWEL[ch]
+        elif ch in SMALL_VOWEL:
+            syllables.append(SMALL_VOWEL[ch])
+        elif ch in KANA:
+            r = KANA[ch]
+            if double and r[0] not in "aiueon-":
+                r = r[0] + r
+            syllables.append(r)
+        else:
+            return None
+        double = False
+    return "".join(syllables) or None
+
+
+def load_kana(path, errors=None, domains=None):
+    # 1行は「読み,表記」か「読み,表記,分類」（読みはひらがなかカタカナ）。load_dict と同じ形で返す
+    word_dict = {}
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            parts = line.split(",")
+            romaji = kana_to_romaji(parts[0]) if len(parts) in (2, 3) and all(parts) else None
+            if len(parts) not in (2, 3) or not all(parts):
+                reason = "「読み,表記[,分類]」の形式ではありません"
+            elif romaji is None:
+                reason = "ローマ字に変換できない文字が含まれています"
+            else:
+                word_dict[romaji] = parts[1]
+                if domains is not None:
+                    domains.setdefault(romaji, set()).update(parts[2].split("|") if len(parts) == 3 else [GENERAL])
+                continue
+            if errors is not None:
+                errors.append((lineno, line, reason))
+    return word_dict
+
+# =============================== 書き出し ===============================
+# ヘッダ（MAGIC・版・メタ情報の長さ）、メタ情報の JSON、8バイト境界に揃えた各列の順に並ぶ。
+# 語番号は VowelIndex と同じ（辞書の行順）なので、同順位の並びもテキストから作ったときと変わらない
+#   romaji / words / vowels        文字列表（UTF-8 を連結したもの）と、その開始位置（語数+1 個）
+#   chouon                         長音語なら 1
+#   lengths                        母音列の長さ
+#   masks                          分類ビット
+#   plain_ids / chouon_ids         通常語・長音語の語番号を、母音列の辞書順（同じなら語番号順）に並べたもの
+#   node_*                         トライのノード表（番号は幅優先順で、子の番号は連続する）
+#     node_char                      親からの母音
+#     node_children                  子の番号の始まり（ノード数+1 個。node_children[n]:node_children[n+1]）
+#     node_plain_lo/end/hi           plain_ids の区間。lo:end はここで母音列が終わる語、lo:hi はこの下の語すべて
+#     node_chouon_lo/end             chouon_ids の区間（ここで母音列が終わる長音語）
+#     node_mask                      この下にある語の分類ビット
+#   keypad                         ブラウザ側キーパッドに渡す JSON（VowelIndex.compiled_json()）
+
+def string_table(strings):
+    blob = bytearray()
+    offsets = array("I", [0])
+    for s in strings:
+        blob += s.encode("utf-8")
+        offsets.append(len(blob))
+    return offsets, bytes(blob)
+
+
+def node_table(index, columns):
+    plain_ids, chouon_ids = array("I"), array("I")
+    ranges = {}
+
+    # 深さ優先（子は母音の順）で語番号を並べると、どのノードの下の語も連続した区間になる
+    def visit(node):
+        p_lo, c_lo = len(plain_ids), len(chouon_ids)
+        plain_ids.extend(node.plain)
+        chouon_ids.extend(node.chouon)
+        p_end, c_end = len(plain_ids), len(chouon_ids)
+        for ch in sorted(node.children):
+            visit(node.children[ch])
+        ranges[id(node)] = (p_lo, p_end, len(plain_ids), c_lo, c_end)
+
+    visit(index.root)
+    names = ("node_plain_lo", "node_plain_end", "node_plain_hi", "node_chouon_lo", "node_chouon_end")
+    for name in names:
+        columns[name] = array("I")
+    columns["node_char"] = bytearray()
+    columns["node_children"] = array("I")
+    columns["node_mask"] = array("I")
+    order = [(index.root, "")]
+    for node, ch in order:  # 幅優先。子はこのあと order に足されるので、番号が連続する
+        columns["node_children"].append(len(order))
+        order.extend((node.children[c], c) for c in sorted(node.children))
+        columns["node_char"].append(ord(ch) if ch else 0)
+        columns["node_mask"].append(node.mask)
+        for name, value in zip(names, ranges[id(node)]):
+            columns[name].append(value)
+    columns["node_children"].append(len(order))
+    columns["node_char"] = bytes(columns["node_char"])
+    columns["plain_ids"], columns["chouon_ids"] = plain_ids, chouon_ids
+
+
+def compile_index(index, path, sources=None):
+    entries = index.entries
+    columns = {}
+    columns["romaji_offsets"], columns["romaji"] = string_table(r for r, _, _ in entries)
+    columns["words_offsets"], columns["words"] = string_table(j for _, j, _ in entries)
+    columns["vowels_offsets"], columns["vowels"] = string_table(v for _, _, v in entries)
+    columns["chouon"] = bytes("-" in r for r, _, _ in entries)
+    columns["lengths"] = array("H", (len(v) for _, _, v in entries))
+    columns["masks"] = array("I", index.masks)
+    node_table(index, columns)
+    columns["keypad"] = index.compiled_json()
+
+    sections = {}
+    meta = {
+        "count": len(entries),
+        "nodes": len(columns["node_char"]),
+        "byteorder": sys.byteorder,
+        "domains": index.domain_bits,
+        "sources": sources or {},
+        "sections": sections,
+    }
+    # メタ情報の長さが決まらないと各列の位置が決まらないので、長さが落ち着くまで詰め直す
+    body_start = 0
+    while True:
+        pos = body_start
+        for name, column in columns.items():
+            data = column.tobytes() if isinstance(column, array) else column
+            typecode = column.typecode if isinstance(column, array) else "B"
+            sections[name] = [pos, len(data), typecode]
+            pos += -(-len(data) // ALIGN) * ALIGN
+        encoded = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+        start = -(-(HEADER.size + len(encoded)) // ALIGN) * ALIGN
+        if start == body_start:
+            break
+        body_start = start
+
+    # 書き終わってから置き換えるので、動いているプロセスが書きかけのファイルを開くことはない
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(encoded)))
+        f.write(encoded)
+        for name, column in columns.items():
+            data = column.tobytes() if isinstance(column, array) else column
+            f.seek(sections[name][0])
+            f.write(data)
+        f.truncate(pos)
+    os.replace(tmp, path)
+    return meta
+
+# =============================== mmap して使う ===============================
+# MappedIndex は VowelIndex と同じ使い方（lookup_ids / fuzzy_ids / step / narrow、IncrementalMatcher）ができる。
+# トライの位置はノード表の番号（int）で、検索はノード表と plain_ids / chouon_ids の区間を切り出すだけ。
+# Python のオブジェクトは検索結果の語番号のリストしか作らず、(ローマ字, 表記, 母音列) は
+# 表示する候補の分だけ文字列表から取り出す。起動時にするのは mmap とメタ情報の読み込みだけ
+
+class MappedEntries:
+    # entries[i] -> (ローマ字, 表記, 母音列)。VowelIndex.entries と同じ並び
+    def __init__(self, index):
+        self.index = index
+
+    def __len__(self):
+        return self.index.count
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.index.count:
+            raise IndexError(i)
+        s = self.index.string
+        return s("romaji", i), s("words", i), s("vowels", i)
+
+    def __iter__(self):
+        return (self[i] for i in range(self.index.count))
+
+
+U, N = ord("u"), ord("n")
+
+
+class MappedIndex(VowelIndex):
+    root = 0
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, meta_size = HEADER.unpack_from(self.mm)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: vowel_compile.py で作った（版 {VERSION} の）索引ではありません")
+        self.meta = json.loads(self.mm[HEADER.size:HEADER.size + meta_size].decode("utf-8"))
+        if self.meta["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path}: バイト順が違うマシンで作られた索引です")
+        with memoryview(self.mm) as view:
+            for name, (offset, size, typecode) in self.meta["sections"].items():
+                if offset + size > len(view):
+                    raise ValueError(f"{path}: 索引ファイルが途中で切れています（{name}）")
+                setattr(self, name, view[offset:offset + size].cast(typecode))
+        self.count = self.meta["count"]
+        self.domain_bits = self.meta["domains"]
+        self.entries = MappedEntries(self)
+
+    def close(self):
+        for name in self.meta["sections"]:
+            getattr(self, name).release()
+        self.mm.close()
+
+    def string(self, name, i):
+        offsets = getattr(self, name + "_offsets")
+        return getattr(self, name)[offsets[i]:offsets[i + 1]].tobytes().decode("utf-8")
+
+    def word(self, i):
+        return self.string("words", i)
+
+    def step(self, nodes, ch, mask=None):
+        keys = (U, N) if ch == "u" else (ord(ch),)
+        first, char, node_mask = self.node_children, self.node_char, self.node_mask
+        result = []
+        for node in nodes:
+            for child in range(first[node], first[node + 1]):
+                if char[child] in keys and (mask is None or node_mask[child] & mask):
+                    result.append(child)
+        return result
+
+    def collect(self, nodes, matched, mask):
+        # nodes は pattern[:-1] まで、matched は pattern まで辿ったノード。規則は VowelIndex.lookup_ids と同じ
+        chouon, plain = self.chouon_ids, self.plain_ids
+        c_lo, c_end, p_lo, p_hi = self.node_chouon_lo, self.node_chouon_end, self.node_plain_lo, self.node_plain_hi
+        first = self.node_children
+        ids = []
+        # 長音語：母音が入力より1つ少ない
+        for node in nodes:
+            ids.extend(chouon[c_lo[node]:c_end[node]])
+        for node in matched:
+            # 長音語：母音数が入力と同じ / 1つ多い
+            ids.extend(chouon[c_lo[node]:c_end[node]])
+            for child in range(first[node], first[node + 1]):
+                ids.extend(chouon[c_lo[child]:c_end[child]])
+            # 通常語：この下の語すべて（区間1つ）
+            ids.extend(plain[p_lo[node]:p_hi[node]])
+        ids.sort()
+        return self.only(ids, mask)
+
+    def lookup_ids(self, input_pattern, mask=None):
+        if not input_pattern:
+            return []
+        nodes = [self.root]
+        for ch in input_pattern[:-1]:
+            nodes = self.step(nodes, ch, mask)
+            if not nodes:
+                return []
+        return self.collect(nodes, self.step(nodes, input_pattern[-1], mask), mask)
+
+    def narrow(self, nodes, ids, pattern, mask=None):
+        # 直前の候補を絞り込むより、区間を切り出し直すほうが速い（語の文字列を読まずに済む）
+        matched = self.step(nodes, pattern[-1], mask)
+        return matched, self.collect(nodes, matched, mask)
+
+    def fuzzy_ids(self, input_pattern, max_distance, mask=None):
+        # VowelIndex.fuzzy_ids と同じ走査を、ノード表の上で行う
+        il = len(input_pattern)
+        if not il or max_distance <= 0:
+            return []
+        chouon, plain = self.chouon_ids, self.plain_ids
+        c_lo, c_end = self.node_chouon_lo, self.node_chouon_end
+        p_lo, p_end, p_hi = self.node_plain_lo, self.node_plain_end, self.node_plain_hi
+        first, char, node_mask = self.node_children, self.node_char, self.node_mask
+        codes = [ord(p) for p in input_pattern]
+        found = []
+        if il <= max_distance:
+            found.extend((i, il) for i in plain[p_lo[0]:p_end[0]])
+        if 0 < il - 1 <= max_distance:
+            found.extend((i, il - 1) for i in chouon[c_lo[0]:c_end[0]])
+        stack = [(self.root, list(range(il + 1)), il)]
+        while stack:
+            node, row, best = stack.pop()
+            for child in range(first[node], first[node + 1]):
+                if mask is not None and not node_mask[child] & mask:
+                    continue
+                ch = char[child]
+                new = [row[0] + 1]
+                for i, p in enumerate(codes, 1):
+                    cost = 0 if ch == p or (p == U and ch == N) else 1
+                    new.append(min(row[i] + 1, new[i - 1] + 1, row[i - 1] + cost))
+                child_best = min(best, new[il])
+                if c_end[child] > c_lo[child]:
+                    d = min(row[il], new[il], new[il - 1])
+                    if 0 < d <= max_distance:
+                        found.extend((i, d) for i in chouon[c_lo[child]:c_end[child]])
+                if min(new) <= max_distance:
+                    if 0 < child_best <= max_distance:
+                        found.extend((i, child_best) for i in plain[p_lo[child]:p_end[child]])
+                    stack.append((child, new, child_best))
+                elif 0 < child_best <= max_distance:
+                    found.extend((i, child_best) for i in plain[p_lo[child]:p_hi[child]])
+        found.sort()
+        if mask is not None:
+            found = [(i, d) for i, d in found if self.masks[i] & mask]
+        return found
+
+    def rank_keys(self, input_vowels):
+        # sort_key と同じ値を、文字列を取り出さずに長さ・長音フラグ・母音列のバイト列から作る
+        il = len(input_vowels)
+        target = input_vowels.encode("ascii")
+        lengths, chouon, offsets, vowels = self.lengths, self.chouon, self.vowels_offsets, self.vowels
+
+        def key(i, distance=0):
+            wl = lengths[i]
+            if distance:
+                return (3 + distance, abs(wl - il))
+            if wl == il:
+                return (0 if vowels[offsets[i]:offsets[i + 1]] == target else 1, 0)
+            if chouon[i] and abs(wl - il) == 1:
+                return (2, 1)
+            return (3, abs(wl - il))
+        return key
+
+    def compiled_json(self):
+        # コンパイル時に作った JSON をそのまま返す（Python のリストには戻さない）
+        return self.keypad
+
+    def compiled(self):
+        return json.loads(self.keypad.tobytes().decode("utf-8"))
+
+
+# 壊れた・版の違う索引ファイルを開いたときに出る例外（呼ぶ側はテキストから作り直せばよい）
+OPEN_ERRORS = (OSError, ValueError, KeyError, TypeError, struct.error)
+
+
+def open_index(path):
+    return MappedIndex(path)
+
+
+def file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+# =============================== CLI ===============================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="辞書を mmap できる索引ファイルにコンパイルする")
+    parser.add_argument("dicts", nargs="*", help="romaji_words.txt 形式の辞書（「ローマ字,表記[,分類]」）")
+    parser.add_argument("--kana", action="append", default=[], help="「読み,表記[,分類]」の単語リスト（複数可）")
+    parser.add_argument("-o", "--out", default="romaji_words.idx", help="書き出す索引ファイル")
+    parser.add_argument("--romaji-out", help="かなから作ったローマ字の行を romaji_words.txt 形式で書き出す")
+    args = parser.parse_args(argv)
+    if not args.dicts and not args.kana:
+        parser.error("辞書か --kana を1つ以上指定してください")
+
+    start = time.perf_counter()
+    word_dict = {}
+    domains = {}
+    sources = {}
+    for path, loader in [(p, load_dict) for p in args.dicts] + [(p, load_kana) for p in args.kana]:
+        errors = []
+        loaded = {}
+        words = loader(path, errors, loaded)
+        for lineno, line, reason in errors:
+            print(f"{path}:{lineno}: {reason}: {line!r}", file=sys.stderr)
+        for r, j in words.items():
+            # 同じローマ字が先に出ていれば表記は先のものを残し、分類だけ合わせる
+            word_dict.setdefault(r, j)
+            domains.setdefault(r, set()).update(loaded[r])
+        if loader is load_kana and args.romaji_out:
+            with open(args.romaji_out, "a", encoding="utf-8") as f:
+                f.writelines(f"{r},{j},{'|'.join(sorted(loaded[r]))}\n" for r, j in words.items())
+        sources[os.path.basename(path)] = file_digest(path)
+
+    meta = compile_index(VowelIndex(word_dict, domains), args.out, sources)
+    compiled = time.perf_counter() - start
+    start = time.perf_counter()
+    open_index(args.out)
+    print(json.dumps({
+        "out": args.out,
+        "entries": meta["count"],
+        "bytes": os.path.getsize(args.out),
+        "compile_s": round(compiled, 3),
+        "open_s": round(time.perf_counter() - start, 6),
+    }, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,469 @@
+import json
+import re
+import sys
+from array import array
+from functools import lru_cache
+
+# =============================== 母音エンジン ===============================
+# experiment_app.py から母音の抽出・照合・並べ替えを切り出したもの。
+# streamlit / gspread に依存しないので、オフライン解析や候補表の事前計算からも使える
+
+# =============================== 母音処理関数 ===============================
+def is_chouon_word(romaji):
+    return "-" in romaji
+
+def match_pattern(word_vowels, input_pattern, romaji_word):
+    if not input_pattern:
+        return False
+    chouon = is_chouon_word(romaji_word)
+    wl, il = len(word_vowels), len(input_pattern)
+
+    if chouon:
+        if abs(wl - il) > 1:
+            return False
+        w_cut = word_vowels[:min(wl, il)]
+        i_cut = input_pattern[:min(wl, il)]
+    else:
+        if il > wl:
+            return False
+        w_cut = word_vowels[:il]
+        i_cut = input_pattern
+
+    for w, i in zip(w_cut, i_cut):
+        if i == "u":
+            if w not in ["u", "n"]:
+                return False
+        else:
+            if w != i:
+                return False
+    return True
+
+def sort_key(item, input_vowels, distance=0):
+    r, j, vowels = item
+    wl = len(vowels)
+    il = len(input_vowels)
+    chouon = "-" in r
+
+    # あいまい一致（編集距離 1, 2）は完全に一致したものすべての後ろ
+    if distance:
+        return (3 + distance, abs(wl - il))
+    if vowels == input_vowels:
+        return (0, abs(wl - il))
+    if wl == il:
+        return (1, abs(wl - il))
+    if chouon and abs(wl - il) == 1:
+        return (2, abs(wl - il))
+    return (3, abs(wl - il))
+
+# =============================== あいまい一致 ===============================
+# 打ち間違い（1文字の余分・抜け・押し違い）を許して候補を出す。距離は入力と
+#   通常語：母音列の先頭部分（どの長さでもよい）
+#   長音語：母音列そのもの / 最後の1文字を除いたもの / 入力の最後の1文字を除いたものと比べる
+# ときの編集距離の最小値で、「う」=「u/n」は一致として数える。距離 0 が従来の一致と同じになる。
+# 短い入力で何にでも一致しないよう、許す距離は入力 3 文字ごとに 1 まで
+FUZZY_CHARS_PER_EDIT = 3
+
+def fuzzy_budget(input_pattern, max_distance):
+    return min(max_distance, len(input_pattern) // FUZZY_CHARS_PER_EDIT)
+
+# =============================== 辞書読み込み ===============================
+# 1行は「ローマ字,表記」か「ローマ字,表記,分類」。分類は質問ごとの辞書の名前で、
+# 「taste|body」のように複数書ける。分類の無い行は general（どの質問にも出す語）になる。
+# どの質問にも含めない分類（talk = あいさつ・返事など、daily = 身の回りの物・人・時・動作）の語は、
+# 分類を絞らないとき（vowel_engine.py の CLI など）だけ候補になる
+ROMAJI_PATTERN = re.compile(r"[a-z-]+")
+DOMAIN_PATTERN = re.compile(r"[a-z_]+(\|[a-z_]+)*")
+GENERAL = "general"
+
+def load_dict(path, errors=None, domains=None):
+    # 不正な行は読み飛ばし、errors が渡されていれば (行番号, 行, 理由) を追加する。
+    # domains が渡されていれば ローマ字 -> 分類名の集合 を入れる（同じ語が何度も出てくれば合わせる）
+    word_dict = {}
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            parts = line.split(",")
+            if len(parts) not in (2, 3) or not all(parts):
+                reason = "「ローマ字,表記[,分類]」の形式ではありません"
+            elif not ROMAJI_PATTERN.fullmatch(parts[0]):
+                reason = "ローマ字に使えない文字が含まれています"
+            elif len(parts) == 3 and not DOMAIN_PATTERN.fullmatch(parts[2]):
+                reason = "分類に使えない文字が含まれています"
+            else:
+                word_dict[parts[0]] = parts[1]
+                if domains is not None:
+                    domains.setdefault(parts[0], set()).update(parts[2].split("|") if len(parts) == 3 else [GENERAL])
+                continue
+            if errors is not None:
+                errors.append((lineno, line, reason))
+    return word_dict
+
+def extract_vowels(word):
+    vowels = "aiueo"
+    result = []
+    i = 0
+    while i < len(word):
+        if word[i] == "n":
+            count = 1
+            while i + count < len(word) and word[i + count] == "n":
+                count += 1
+            result.append("u" * (count // 2))
+            i += count
+            continue
+        if word[i] == "-":
+            result.append(result[-1] if result else "")
+            i += 1
+            continue
+        if word[i] in vowels:
+            result.append(word[i])
+        i += 1
+    return "".join(result)
+
+# =============================== 母音インデックス ===============================
+# 抽出済み母音列のトライ。match_pattern と同じ規則（「う」=「u/n」、長音語の±1）で
+# 一致する単語だけを辿るので、検索コストは辞書サイズではなく一致件数に比例する。
+#
+# 質問ごとの辞書（分類）は語を複製せず、語ごとの分類ビット（masks）と、
+# 各ノードの「この下にある語の分類ビットの OR」で表す。検索に mask を渡すと、
+# その分類の語が1つも無い枝には入らない。分類が増えても増えるのはビットだけ
+class VowelTrieNode:
+    __slots__ = ("children", "plain", "chouon", "mask")
+
+    def __init__(self):
+        self.children = {}
+        self.plain = []   # この位置で母音列が終わる通常語の番号
+        self.chouon = []  # この位置で母音列が終わる長音語の番号
+        self.mask = 0     # この位置から下にある語の分類ビット
+
+
+class VowelIndex:
+    def __init__(self, word_dict, domains=None):
+        self.entries = []
+        self.masks = array("L")
+        self.domain_bits = {GENERAL: 1}  # 分類名 -> ビット
+        self.root = VowelTrieNode()
+        self.payload = None
+        for r, j in word_dict.items():
+            v = extract_vowels(r)
+            mask = self.domain_mask(domains.get(r, (GENERAL,)) if domains else (GENERAL,), add=True)
+            node = self.root
+            node.mask |= mask
+            for ch in v:
+                child = node.children.get(ch)
+                if child is None:
+                    child = node.children[ch] = VowelTrieNode()
+                node = child
+                node.mask |= mask
+            if is_chouon_word(r):
+                node.chouon.append(len(self.entries))
+            else:
+                node.plain.append(len(self.entries))
+            self.entries.append((r, j, v))
+            self.masks.append(mask)
+
+    def domain_mask(self, names, add=False):
+        # 分類名の並び -> ビットの OR。知らない分類は（add=False なら）どの語にも一致しない
+        mask = 0
+        for name in names:
+            if add and name not in self.domain_bits:
+                self.domain_bits[name] = 1 << len(self.domain_bits)
+            mask |= self.domain_bits.get(name, 0)
+        return mask
+
+    def step(self, nodes, ch, mask=None):
+        keys = ("u", "n") if ch == "u" else (ch,)
+        result = []
+        for node in nodes:
+            for k in keys:
+                child = node.children.get(k)
+                if child is not None and (mask is None or child.mask & mask):
+                    result.append(child)
+        return result
+
+    def word(self, i):
+        return self.entries[i][1]
+
+    def rank_keys(self, input_vowels):
+        # 語番号 -> sort_key の値（RankedCandidates に語番号を渡すときに使う）
+        entries = self.entries
+        return lambda i, distance=0: sort_key(entries[i], input_vowels, distance)
+
+    def compiled_json(self):
+        return json.dumps(self.compiled(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def compiled(self):
+        # ブラウザ側の母音キーパッドに渡す形（列ごとの配列）。1プロセスで1回だけ作る
+        if self.payload is None:
+            self.payload = {
+                "romaji": [r for r, _, _ in self.entries],
+                "words": [j for _, j, _ in self.entries],
+                "vowels": [v for _, _, v in self.entries],
+                "chouon": [is_chouon_word(r) for r, _, _ in self.entries],
+                "masks": list(self.masks),
+                "domains": dict(self.domain_bits),
+            }
+        return self.payload
+
+    def lookup(self, input_pattern, mask=None):
+        return [self.entries[i] for i in self.lookup_ids(input_pattern, mask)]
+
+    def lookup_ids(self, input_pattern, mask=None):
+        # mask（domain_mask の値）を渡すとその分類の語だけ。None なら全部
+        if not input_pattern:
+            return []
+        nodes = [self.root]
+        for ch in input_pattern[:-1]:
+            nodes = self.step(nodes, ch, mask)
+            if not nodes:
+                return []
+
+        ids = []
+        # 長音語：母音が入力より1つ少ない
+        for node in nodes:
+            ids.extend(node.chouon)
+
+        for node in self.step(nodes, input_pattern[-1], mask):
+            # 長音語：母音数が入力と同じ / 1つ多い
+            ids.extend(node.chouon)
+            for child in node.children.values():
+                ids.extend(child.chouon)
+            # 通常語：入力が母音列の先頭に一致すればすべて
+            stack = [node]
+            while stack:
+                n = stack.pop()
+                ids.extend(n.plain)
+                stack.extend(c for c in n.children.values() if mask is None or c.mask & mask)
+
+        # 辞書順に戻す（sort_key で同順位のときの並びを従来と揃える）
+        ids.sort()
+        return self.only(ids, mask)
+
+    def narrow(self, nodes, ids, pattern, mask=None):
+        # pattern[:-1] までの (トライ上の位置, 候補番号) から、1文字足した pattern の分を作る。
+        # 直前の候補だけを絞り込み、長音語は「母音が入力より1つ多い」ものが新たに一致するので、そこだけ追加する
+        entries = self.entries
+        nodes = self.step(nodes, pattern[-1], mask)
+        ids = [i for i in ids if match_pattern(entries[i][2], pattern, entries[i][0])]
+        added = self.only([i for node in nodes for child in node.children.values() for i in child.chouon], mask)
+        if added:
+            ids.extend(added)
+            ids.sort()
+        return nodes, ids
+
+    def only(self, ids, mask):
+        if mask is None:
+            return ids
+        masks = self.masks
+        return [i for i in ids if masks[i] & mask]
+
+    def fuzzy_ids(self, input_pattern, max_distance, mask=None):
+        # 距離 1..max_distance の単語を (番号, 距離) で辞書順に返す（距離 0 は lookup_ids の分）。
+        # トライを辿りながら編集距離の表を1行ずつ作り、行の最小値が max_distance を超えた枝は打ち切る
+        il = len(input_pattern)
+        if not il or max_distance <= 0:
+            return []
+        found = []
+        # 母音の無い語（根）は入力を全部消した距離
+        if il <= max_distance:
+            found.extend((i, il) for i in self.root.plain)
+        if 0 < il - 1 <= max_distance:
+            found.extend((i, il - 1) for i in self.root.chouon)
+        stack = [(self.root, list(range(il + 1)), il)]  # (ノード, 距離の行, 通った位置での入力全体との最小距離)
+        while stack:
+            node, row, best = stack.pop()
+            for ch, child in node.children.items():
+                if mask is not None and not child.mask & mask:
+                    continue
+                new = [row[0] + 1]
+                for i, p in enumerate(input_pattern, 1):
+                    cost = 0 if ch == p or (p == "u" and ch == "n") else 1
+                    new.append(min(row[i] + 1, new[i - 1] + 1, row[i - 1] + cost))
+                child_best = min(best, new[il])
+                if child.chouon:
+                    d = min(row[il], new[il], new[il - 1])
+                    if 0 < d <= max_distance:
+                        found.extend((i, d) for i in child.chouon)
+                if min(new) <= max_distance:
+                    if 0 < child_best <= max_distance:
+                        found.extend((i, child_best) for i in child.plain)
+                    stack.append((child, new, child_best))
+                elif 0 < child_best <= max_distance:
+                    # これより深い長音語は届かないが、通常語は先頭部分の距離のまま一致する
+                    subtree = [child]
+                    while subtree:
+                        n = subtree.pop()
+                        found.extend((i, child_best) for i in n.plain)
+                        subtree.extend(n.children.values())
+        found.sort()
+        if mask is not None:
+            found = [(i, d) for i, d in found if self.masks[i] & mask]
+        return found
+
+
+# 1セッション分の入力状態。母音を足すときは直前の候補だけを絞り込み、
+# 削除はスタックを戻すだけなので、1打鍵のコストは現在の候補数に比例する。
+# スタックには語番号だけを持ち、(ローマ字, 表記, 母音列) は表示するページの分だけ index.entries から取り出す。
+# max_distance を 1, 2 にすると、打ち間違いを許した候補（fuzzy_ids）を完全一致の後ろに加える。
+# popularity（表記 -> 選ばれた回数）を渡すと、同じ段階の中を回数の多い順にする。
+# mask（VowelIndex.domain_mask）を渡すと、その分類の語だけを候補にする
+class IncrementalMatcher:
+    def __init__(self, index, max_distance=0, popularity=None, mask=None):
+        self.index = index
+        self.max_distance = max_distance
+        self.popularity = popularity
+        self.mask = mask
+        self.stack = []  # [入力, トライ上の位置, 候補番号, 順位付け済み候補]
+
+    @property
+    def pattern(self):
+        return self.stack[-1][0] if self.stack else ""
+
+    @property
+    def candidates(self):
+        entries = self.index.entries
+        return [entries[i] for i in self.stack[-1][2]] if self.stack else []
+
+    def ranked(self):
+        if not self.stack:
+            return RankedCandidates([], "")
+        top = self.stack[-1]
+        if top[3] is None:
+            fuzzy = []
+            budget = fuzzy_budget(top[0], self.max_distance)
+            if budget:
+                fuzzy = self.index.fuzzy_ids(top[0], budget, self.mask)
+            top[3] = RankedCandidates(top[2], top[0], fuzzy, self.popularity, self.index)
+        return top[3]
+
+    def push(self, ch):
+        pattern = self.pattern + ch
+        if not self.stack:
+            nodes = self.index.step([self.index.root], ch, self.mask)
+            ids = self.index.lookup_ids(pattern, self.mask)
+        else:
+            nodes, ids = self.index.narrow(self.stack[-1][1], self.stack[-1][2], pattern, self.mask)
+        self.stack.append([pattern, nodes, ids, None])
+
+    def pop(self):
+        if self.stack:
+            self.stack.pop()
+
+
+# sort_key の値（段階, 長さの差）ごとに候補を振り分けて上から取り出す。
+# バケット内は辞書順のままなので、全件ソートと同じ並び（同順位の順も含む）になる。
+# fuzzy は (候補, 編集距離) の並びで、完全一致の後ろの段階に入る。
+# popularity があれば、表示するバケットだけを回数の多い順（同数なら辞書順）に並べ直す。
+# index を渡すと candidates / fuzzy の候補は語番号で、ページに出す分だけを index.entries から取り出す
+class RankedCandidates:
+    def __init__(self, candidates, input_vowels, fuzzy=(), popularity=None, index=None):
+        if index is not None:
+            key = index.rank_keys(input_vowels)
+        else:
+            key = lambda item, distance=0: sort_key(item, input_vowels, distance)
+        buckets = {}
+        for item in candidates:
+            buckets.setdefault(key(item), []).append(item)
+        for item, distance in fuzzy:
+            buckets.setdefault(key(item, distance), []).append(item)
+        self.buckets = [buckets[k] for k in sorted(buckets)]
+        self.total = len(candidates) + len(fuzzy)
+        self.popularity = popularity
+        self.index = index
+        self.ordered = [not popularity] * len(self.buckets)
+
+    def bucket(self, k):
+        if not self.ordered[k]:
+            get = self.popularity.get
+            word = self.index.word if self.index is not None else lambda item: item[1]
+            self.buckets[k].sort(key=lambda item: -get(word(item), 0))
+            self.ordered[k] = True
+        return self.buckets[k]
+
+    def top(self, k):
+        return self.page(0, k)
+
+    def page(self, page, size=6):
+        start, end = page * size, (page + 1) * size
+        result = []
+        pos = 0
+        for k, bucket in enumerate(self.buckets):
+            if pos >= end:
+                break
+            if pos + len(bucket) > start:
+                result.extend(self.bucket(k)[max(start - pos, 0):end - pos])
+            pos += len(bucket)
+        if self.index is not None:
+            entries = self.index.entries
+            result = [entries[i] for i in result]
+        return result
+
+    def page_count(self, size=6):
+        return (self.total + size - 1) // size
+
+# =============================== 一括処理 CLI ===============================
+# 1行1入力（母音列そのもの、または記録済みの JSON 行）を読み、上位 k 件の候補を JSONL で流す
+#   python vowel_engine.py inputs.txt -k 6 > candidates.jsonl
+#   cat log.jsonl | python vowel_engine.py --field input_vowels
+#   python vowel_engine.py inputs.txt --domain body --domain general
+
+def candidate_table(index, k, mask=None):
+    # 同じ入力が何度も出てくるので、入力ごとに JSON 化した結果を使い回す
+    @lru_cache(maxsize=65536)
+    def lookup(pattern):
+        ranked = RankedCandidates(index.lookup(pattern, mask), pattern)
+        candidates = [{"romaji": r, "word": j, "vowels": v} for r, j, v in ranked.top(k)]
+        return json.dumps(
+            {"input": pattern, "total": ranked.total, "candidates": candidates}, ensure_ascii=False
+        )
+    return lookup
+
+
+def read_inputs(paths, field):
+    for path in paths or ["-"]:
+        f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+        try:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                if line.startswith("{"):
+                    record = json.loads(line)
+                    yield record.get(field) or "", record
+                else:
+                    yield line, None
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="母音列ごとの候補（上位 k 件）を JSONL で出力する")
+    parser.add_argument("inputs", nargs="*", help="入力ファイル（省略時・'-' は標準入力）")
+    parser.add_argument("--dict", default="romaji_words.txt", help="辞書ファイル")
+    parser.add_argument("-k", type=int, default=6, help="出力する候補数")
+    parser.add_argument("--field", default="input", help="JSON 行から母音列を取り出すキー")
+    parser.add_argument("--domain", action="append", help="候補にする分類（複数可。省略時はすべて）")
+    args = parser.parse_args(argv)
+
+    errors = []
+    domains = {}
+    index = VowelIndex(load_dict(args.dict, errors, domains), domains)
+    for lineno, line, reason in errors:
+        print(f"{args.dict}:{lineno}: {reason}: {line!r}", file=sys.stderr)
+
+    lookup = candidate_table(index, args.k, index.domain_mask(args.domain) if args.domain else None)
+    out = sys.stdout
+    for pattern, record in read_inputs(args.inputs, args.field):
+        result = lookup(pattern)
+        if record is not None:
+            result = result[:-1] + ', "record": ' + json.dumps(record, ensure_ascii=False) + "}"
+        out.write(result + "\n")
+    out.flush()
+
+
+if __name__ == "__main__":
+    main()
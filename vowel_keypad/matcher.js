@@ -0,0 +1,160 @@
+// vowel_engine.py の match_pattern / sort_key / RankedCandidates と同じ規則をブラウザ側で行う
+"use strict";
+
+function matchPattern(wordVowels, input, chouon) {
+  if (!input) return false;
+  const wl = wordVowels.length, il = input.length;
+  let n;
+  if (chouon) {
+    if (Math.abs(wl - il) > 1) return false;
+    n = Math.min(wl, il);
+  } else {
+    if (il > wl) return false;
+    n = il;
+  }
+  for (let k = 0; k < n; k++) {
+    const w = wordVowels[k], i = input[k];
+    if (i === "u") {
+      if (w !== "u" && w !== "n") return false;
+    } else if (w !== i) {
+      return false;
+    }
+  }
+  return true;
+}
+
+function sortKey(wordVowels, input, chouon) {
+  const wl = wordVowels.length, il = input.length, d = Math.abs(wl - il);
+  if (wordVowels === input) return [0, d];
+  if (wl === il) return [1, d];
+  if (chouon && d === 1) return [2, d];
+  return [3, d];
+}
+
+// 打ち間違いを許す候補（vowel_engine.py の fuzzy_budget / VowelIndex.fuzzy_ids と同じ）
+const FUZZY_CHARS_PER_EDIT = 3;
+
+function buildTrie(index, ids) {
+  const newNode = () => ({ children: new Map(), plain: [], chouon: [] });
+  const root = newNode();
+  ids.forEach((i) => {
+    let node = root;
+    for (const ch of index.vowels[i]) {
+      if (!node.children.has(ch)) node.children.set(ch, newNode());
+      node = node.children.get(ch);
+    }
+    (index.chouon[i] ? node.chouon : node.plain).push(i);
+  });
+  return root;
+}
+
+function fuzzyIds(root, input, maxDistance) {
+  // [番号, 距離] の並び（距離 1..maxDistance、辞書順）
+  const il = input.length;
+  if (!il || maxDistance <= 0) return [];
+  const found = [];
+  if (il <= maxDistance) for (const i of root.plain) found.push([i, il]);
+  if (il - 1 > 0 && il - 1 <= maxDistance) for (const i of root.chouon) found.push([i, il - 1]);
+  const stack = [[root, Array.from({ length: il + 1 }, (_, i) => i), il]];
+  while (stack.length) {
+    const [node, row, best] = stack.pop();
+    for (const [ch, child] of node.children) {
+      const next = [row[0] + 1];
+      for (let i = 1; i <= il; i++) {
+        const p = input[i - 1];
+        const cost = ch === p || (p === "u" && ch === "n") ? 0 : 1;
+        next.push(Math.min(row[i] + 1, next[i - 1] + 1, row[i - 1] + cost));
+      }
+      const childBest = Math.min(best, next[il]);
+      if (child.chouon.length) {
+        const d = Math.min(row[il], next[il], next[il - 1]);
+        if (d > 0 && d <= maxDistance) for (const i of child.chouon) found.push([i, d]);
+      }
+      if (Math.min(...next) <= maxDistance) {
+        if (childBest > 0 && childBest <= maxDistance) for (const i of child.plain) found.push([i, childBest]);
+        stack.push([child, next, childBest]);
+      } else if (childBest > 0 && childBest <= maxDistance) {
+        const subtree = [child];
+        while (subtree.length) {
+          const n = subtree.pop();
+          for (const i of n.plain) found.push([i, childBest]);
+          subtree.push(...n.children.values());
+        }
+      }
+    }
+  }
+  return found.sort((a, b) => a[0] - b[0]);
+}
+
+// 母音を足すときは直前の候補を絞り込み、長音語（数が少ない）だけは毎回全件から見直す。
+// maxDistance を 1, 2 にすると、打ち間違いを許した候補を完全一致の後ろに加える。
+// popularity（表記 -> 選ばれた回数）があれば、同じ段階の中を回数の多い順にする。
+// mask（分類ビットの OR）があれば、その分類の語だけを候補にする
+class Matcher {
+  constructor(index, maxDistance = 0, popularity = null, mask = null) {
+    this.index = index;
+    this.maxDistance = maxDistance;
+    this.popularity = popularity || {};
+    this.trie = null;  // あいまい一致を初めて使うときに作る
+    this.all = index.vowels.map((_, i) => i).filter((i) => mask === null || index.masks[i] & mask);
+    this.chouon = this.all.filter((i) => index.chouon[i]);
+    this.stack = [];  // {input, ids, ranked}
+  }
+
+  get input() {
+    return this.stack.length ? this.stack[this.stack.length - 1].input : "";
+  }
+
+  count(i) {
+    return this.popularity[this.index.words[i]] || 0;
+  }
+
+  matches(i, input) {
+    return matchPattern(this.index.vowels[i], input, this.index.chouon[i]);
+  }
+
+  push(ch) {
+    const input = this.input + ch;
+    let ids;
+    if (!this.stack.length) {
+      ids = this.all.filter((i) => this.matches(i, input));
+    } else {
+      const prev = this.stack[this.stack.length - 1].ids;
+      ids = prev.filter((i) => !this.index.chouon[i] && this.matches(i, input));
+      const added = this.chouon.filter((i) => this.matches(i, input));
+      if (added.length) ids = ids.concat(added).sort((a, b) => a - b);
+    }
+    this.stack.push({ input, ids, ranked: null });
+  }
+
+  pop() {
+    this.stack.pop();
+  }
+
+  ranked() {
+    if (!this.stack.length) return [];
+    const top = this.stack[this.stack.length - 1];
+    if (top.ranked === null) {
+      const keys = new Map(top.ids.map((i) => [i, sortKey(this.index.vowels[i], top.input, this.index.chouon[i])]));
+      // Array.prototype.sort は安定ソートなので同順位は辞書順のまま
+      top.ranked = top.ids.slice().sort((a, b) => {
+        const ka = keys.get(a), kb = keys.get(b);
+        return ka[0] - kb[0] || ka[1] - kb[1] || this.count(b) - this.count(a);
+      });
+      const budget = Math.min(this.maxDistance, Math.floor(top.input.length / FUZZY_CHARS_PER_EDIT));
+      if (budget) {
+        if (this.trie === null) this.trie = buildTrie(this.index, this.all);
+        const il = top.input.length;
+        const fuzzy = fuzzyIds(this.trie, top.input, budget)
+          .map(([i, d]) => [i, d, Math.abs(this.index.vowels[i].length - il)])
+          .sort((a, b) => a[1] - b[1] || a[2] - b[2] || this.count(b[0]) - this.count(a[0]));
+        top.ranked = top.ranked.concat(fuzzy.map(([i]) => i));
+      }
+    }
+    return top.ranked;
+  }
+}
+
+if (typeof module !== "undefined") {
+  module.exports = { matchPattern, sortKey, fuzzyIds, buildTrie, Matcher };
+}
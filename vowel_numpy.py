@@ -0,0 +1,164 @@
+import json
+import time
+
+try:
+    import numpy as np
+except ImportError:  # numpy はオフライン解析用の任意依存
+    np = None
+
+from vowel_engine import RankedCandidates, VowelIndex, load_dict, match_pattern, sort_key
+
+# =============================== NumPy 一括照合 ===============================
+# 「記録済みの入力 N 件が、それぞれ辞書のどれに一致したか」を一度に計算する任意のバックエンド。
+# 辞書の母音列を uint8 の行列（長さ・長音フラグは別配列）にしておき、
+# match_pattern の規則と sort_key の段階を入力のまとまりごとにベクトル演算で求める。
+# 結果は vowel_engine の VowelIndex + RankedCandidates と完全に一致する
+
+CODES = {ch: k for k, ch in enumerate("aiueon", 1)}  # 0 は詰め物
+UNKNOWN = 7
+
+
+class VectorIndex:
+    def __init__(self, index, chunk_cells=4_000_000):
+        if np is None:
+            raise ImportError("vowel_numpy を使うには numpy が必要です（pip install numpy）")
+        self.entries = index.entries
+        vowels = [v for _, _, v in self.entries]
+        self.lengths = np.array([len(v) for v in vowels], dtype=np.int32)
+        self.chouon = np.array(["-" in r for r, _, _ in self.entries], dtype=bool)
+        width = int(self.lengths.max()) if len(vowels) else 0
+        self.matrix = self.encode(vowels, width)
+        # 一度に作る (入力数 × 辞書サイズ) の真偽値行列の上限
+        self.chunk = max(1, chunk_cells // max(len(vowels), 1))
+
+    @staticmethod
+    def encode(strings, width):
+        table = np.full(256, UNKNOWN, dtype=np.uint8)
+        table[0] = 0
+        for ch, code in CODES.items():
+            table[ord(ch)] = code
+        raw = "".join(s.ljust(width, "\0") for s in strings).encode("ascii", "replace")
+        return table[np.frombuffer(raw, dtype=np.uint8)].reshape(len(strings), width)
+
+    def match(self, patterns):
+        # 戻り値: (一致行列 [入力, 単語], 完全一致行列) 。入力の並びは patterns と同じ
+        width = max((len(p) for p in patterns), default=0)
+        query = self.encode(patterns, width)
+        il = np.array([len(p) for p in patterns], dtype=np.int32)[:, None]
+        wl = self.lengths[None, :]
+        chouon = self.chouon[None, :]
+
+        ok = np.where(chouon, np.abs(wl - il) <= 1, il <= wl) & (il > 0)
+        cutoff = np.where(chouon, np.minimum(wl, il), il)
+        exact = wl == il
+        u, n = CODES["u"], CODES["n"]
+        for k in range(min(width, self.matrix.shape[1])):
+            q = query[:, k][:, None]
+            w = self.matrix[:, k][None, :]
+            same = w == q
+            # 「う」は u と n の両方に一致する
+            ok &= same | ((q == u) & (w == n)) | (k >= cutoff)
+            exact &= same | (k >= il)
+        return ok, exact
+
+    def rank(self, patterns, k=6):
+        # 入力ごとに (一致件数, 上位 k 件の単語番号) を返す。k=None なら全件
+        results = []
+        for start in range(0, len(patterns), self.chunk):
+            chunk = patterns[start:start + self.chunk]
+            ok, exact = self.match(chunk)
+            rows, cols = np.nonzero(ok)
+            il = np.array([len(p) for p in chunk], dtype=np.int32)[rows]
+            wl = self.lengths[cols]
+            delta = np.abs(wl - il)
+            tier = np.where(
+                exact[rows, cols], 0,
+                np.where(wl == il, 1, np.where(self.chouon[cols] & (delta == 1), 2, 3)),
+            )
+            # (入力, 段階, 長さの差, 辞書順) で並べる。辞書順が最後なので同順位の並びも従来どおり
+            order = np.lexsort((cols, delta, tier, rows))
+            rows, cols = rows[order], cols[order]
+            totals = np.bincount(rows, minlength=len(chunk))
+            starts = np.concatenate(([0], np.cumsum(totals)[:-1]))
+            if k is not None:
+                keep = np.arange(len(rows)) - starts[rows] < k
+                rows, cols = rows[keep], cols[keep]
+            bounds = np.searchsorted(rows, np.arange(len(chunk) + 1))
+            for m in range(len(chunk)):
+                results.append((int(totals[m]), cols[bounds[m]:bounds[m + 1]].tolist()))
+        return results
+
+# =============================== 検証・ベンチマーク ===============================
+# python vowel_numpy.py --inputs 5000 --scale 30
+
+def python_rank(index, patterns, k):
+    ids = {id(e): i for i, e in enumerate(index.entries)}
+    results = []
+    for p in patterns:
+        ranked = RankedCandidates(index.lookup(p), p)
+        results.append((ranked.total, [ids[id(e)] for e in ranked.top(k)]))
+    return results
+
+
+def scan_rank(index, patterns, k):
+    # 照合を単語ごとに回す従来のやり方
+    results = []
+    for p in patterns:
+        matched = [i for i, (r, j, v) in enumerate(index.entries) if match_pattern(v, p, r)]
+        matched.sort(key=lambda i: sort_key(index.entries[i], p))
+        results.append((len(matched), matched[:k]))
+    return results
+
+
+def scaled_dict(word_dict, scale):
+    # 同じ母音列を持つ単語を増やして辞書を大きくする（子音 x を挟むので母音列は変わらない）
+    result = {}
+    for n in range(scale):
+        for r, j in word_dict.items():
+            result[r + "x" * n] = j
+    return result
+
+
+def main(argv=None):
+    import argparse
+    import random
+
+    parser = argparse.ArgumentParser(description="NumPy 一括照合を純 Python 版と比較する")
+    parser.add_argument("--dict", default="romaji_words.txt")
+    parser.add_argument("--scale", type=int, default=1, help="辞書を何倍に増やすか")
+    parser.add_argument("--inputs", type=int, default=2000)
+    parser.add_argument("-k", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    index = VowelIndex(scaled_dict(load_dict(args.dict), args.scale))
+    rnd = random.Random(args.seed)
+    patterns = ["".join(rnd.choice("aiueo") for _ in range(rnd.randint(1, 8))) for _ in range(args.inputs)]
+
+    timings = {}
+    start = time.perf_counter()
+    vector = VectorIndex(index)
+    timings["numpy_build"] = time.perf_counter() - start
+    start = time.perf_counter()
+    got = vector.rank(patterns, args.k)
+    timings["numpy"] = time.perf_counter() - start
+    start = time.perf_counter()
+    expected = python_rank(index, patterns, args.k)
+    timings["python_trie"] = time.perf_counter() - start
+    sample = patterns[:max(1, args.inputs // 20)]
+    start = time.perf_counter()
+    scanned = scan_rank(index, sample, args.k)
+    timings["python_scan"] = (time.perf_counter() - start) * len(patterns) / len(sample)
+
+    print(json.dumps({
+        "words": len(index.entries),
+        "inputs": len(patterns),
+        "identical": got == expected and scanned == expected[:len(sample)],
+        "seconds": {name: round(t, 4) for name, t in timings.items()},
+        "speedup_vs_scan": round(timings["python_scan"] / timings["numpy"], 1),
+        "speedup_vs_trie": round(timings["python_trie"] / timings["numpy"], 2),
+    }, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()